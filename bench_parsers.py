@@ -0,0 +1,206 @@
+'''Benchmarks of the kyd parsers on synthetic files.
+
+Every case runs in a fresh process that reports the parsing time and the
+peak resident memory, the results are saved as JSON to be compared with
+a previous run.
+
+    python bench_parsers.py --sizes 1000 10000 -o bench.json
+    python bench_parsers.py --sizes 1000 10000 --compare bench.json
+'''
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import tempfile
+import multiprocessing
+
+from kyd.parsers.b3 import (TaxaSwap, CDIIDI, BVBG028, BVBG086, BVBG087, COTAHIST,
+                            StockIndexInfo)
+from kyd.parsers.anbima import (AnbimaTPF, AnbimaDebentures, AnbimaVnaTPF, parse_titpub,
+                                parse_vnataxatitpub, parse_vnatitpub)
+from kyd.parsers.cvm import (handle_informes_diarios, handle_info_cadastral,
+                             load_informes_diarios, load_info_cadastral)
+from synthetic_files import (gen_cotahist, gen_bvbg028, gen_bvbg086, gen_bvbg087, gen_taxaswap,
+                             gen_cdiidi, gen_stock_index_info, gen_tpf, gen_debentures, gen_vna,
+                             gen_informes_diarios, gen_info_cadastral)
+
+
+def _read_bytes(fname):
+    with open(fname, 'rb') as fp:
+        return fp.read()
+
+
+def _write_csv(fun, fname):
+    buf = io.StringIO()
+    fun(_read_bytes(fname), buf)
+    return buf.getvalue().count('\n')
+
+
+def _map_lines(fun, fname):
+    with open(fname, encoding='latin1') as fp:
+        next(fp)
+        return sum(1 for _ in map(fun, fp))
+
+
+# name: (generator, runner returning the number of records, scales with n)
+CASES = {
+    'cotahist': (gen_cotahist, lambda f: len(COTAHIST(f).data), True),
+    'cotahist_frame': (gen_cotahist, lambda f: len(COTAHIST(f, as_frame=True).data), True),
+    'bvbg028': (gen_bvbg028, lambda f: len(BVBG028(f).data), True),
+    'bvbg028_iterparse': (gen_bvbg028, lambda f: len(BVBG028(f, iterparse=True).data), True),
+    'bvbg086': (gen_bvbg086, lambda f: len(BVBG086(f).data), True),
+    'bvbg086_frame': (gen_bvbg086, lambda f: len(BVBG086(f).to_frame()), True),
+    'bvbg087': (gen_bvbg087, lambda f: len(BVBG087(f).data), True),
+    'bvbg087_iterparse': (gen_bvbg087, lambda f: len(BVBG087(f, iterparse=True).data), True),
+    'taxaswap': (gen_taxaswap, lambda f: len(TaxaSwap(f).data), True),
+    'cdiidi': (gen_cdiidi, lambda f: len(CDIIDI(f).data), False),
+    'stock_index_info': (gen_stock_index_info, lambda f: len(StockIndexInfo(f).data), True),
+    'anbima_tpf': (gen_tpf, lambda f: len(AnbimaTPF(f).data), True),
+    'anbima_debentures': (gen_debentures, lambda f: len(AnbimaDebentures(f).data), True),
+    'anbima_vna': (gen_vna, lambda f: len(AnbimaVnaTPF(f).data), False),
+    'parse_titpub': (gen_tpf, lambda f: _write_csv(parse_titpub, f), True),
+    'parse_vnataxatitpub': (gen_vna, lambda f: _write_csv(parse_vnataxatitpub, f), False),
+    'parse_vnatitpub': (gen_vna, lambda f: _write_csv(parse_vnatitpub, f), False),
+    'cvm_informes_diarios': (gen_informes_diarios,
+                             lambda f: _map_lines(handle_informes_diarios, f), True),
+    'cvm_info_cadastral': (gen_info_cadastral,
+                           lambda f: _map_lines(handle_info_cadastral, f), True),
+    'cvm_informes_diarios_load': (gen_informes_diarios,
+                                  lambda f: sum(map(len, load_informes_diarios(f))), True),
+    'cvm_info_cadastral_load': (gen_info_cadastral,
+                                lambda f: sum(map(len, load_info_cadastral(f))), True),
+}
+
+
+def _max_rss_kb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+def _run_case(name, fname, repeat, conn):
+    run = CASES[name][1]
+    base_rss = _max_rss_kb()
+    times = []
+    try:
+        for _ in range(repeat):
+            t = time.perf_counter()
+            rows = run(fname)
+            times.append(time.perf_counter() - t)
+    except Exception as e:
+        conn.send(e)
+    else:
+        conn.send((rows, min(times), base_rss, _max_rss_kb()))
+    conn.close()
+
+
+def run_case(name, fname, repeat=3):
+    '''Runs a case in a new process and returns its measures.'''
+    ctx = multiprocessing.get_context('spawn')
+    recv, send = ctx.Pipe(duplex=False)
+    proc = ctx.Process(target=_run_case, args=(name, fname, repeat, send))
+    proc.start()
+    send.close()
+    try:
+        result = recv.recv()
+    except EOFError:
+        result = RuntimeError('process exited with code {}'.format(proc.exitcode))
+    finally:
+        proc.join()
+    size = os.path.getsize(fname)
+    if isinstance(result, Exception):
+        return {'case': name, 'bytes': size, 'error': repr(result)}
+    rows, seconds, base_rss, peak_rss = result
+    return {
+        'case': name,
+        'rows': rows,
+        'bytes': size,
+        'seconds': seconds,
+        'rows_per_sec': rows / seconds,
+        'bytes_per_sec': size / seconds,
+        'peak_rss_kb': peak_rss,
+        'rss_delta_kb': peak_rss - base_rss,
+    }
+
+
+def run(cases, sizes, repeat=3, tmpdir=None, log=sys.stderr):
+    results = []
+    with tempfile.TemporaryDirectory(dir=tmpdir) as path:
+        for name in cases:
+            generate, _, scales = CASES[name]
+            for n in sizes if scales else [1]:
+                fname = os.path.join(path, '{}_{}.txt'.format(name, n))
+                generate(fname, n)
+                result = dict(run_case(name, fname, repeat), size=n)
+                os.remove(fname)
+                results.append(result)
+                if 'error' in result:
+                    print('{case:<22} {size:>8} failed: {error}'.format(**result), file=log)
+                    continue
+                print('{case:<22} {size:>8} {rows:>8} rows {seconds:9.4f}s '
+                      '{rows_per_sec:12.0f} rows/s {bytes_per_sec:12.0f} B/s '
+                      '{peak_rss_kb:8d} kB'.format(**result), file=log)
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'repeat': repeat,
+        },
+        'results': results,
+    }
+
+
+def compare(base, new, tolerance=0.1):
+    '''Returns the (case, size, ratio) of the results slower than the base
+    by more than `tolerance`, ratio is the new over the base time.'''
+    base_results = dict(((r['case'], r['size']), r) for r in base['results'])
+    slower = []
+    for r in new['results']:
+        b = base_results.get((r['case'], r['size']))
+        if b is None or 'error' in b:
+            continue
+        if 'error' in r:
+            print('{:<22} {:>8} failed'.format(r['case'], r['size']))
+            slower.append((r['case'], r['size'], float('inf')))
+            continue
+        ratio = r['seconds'] / b['seconds']
+        rss_ratio = r['peak_rss_kb'] / b['peak_rss_kb']
+        print('{:<22} {:>8} time {:6.2f}x rss {:6.2f}x'.format(
+            r['case'], r['size'], ratio, rss_ratio))
+        if ratio > 1 + tolerance:
+            slower.append((r['case'], r['size'], ratio))
+    return slower
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--cases', nargs='+', choices=list(CASES), default=list(CASES))
+    parser.add_argument('--sizes', nargs='+', type=int, default=[1000, 10000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('-o', '--output', help='JSON file to save the results')
+    parser.add_argument('--compare', help='JSON file of a previous run')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='relative slowdown accepted by --compare')
+    args = parser.parse_args(args)
+
+    results = run(args.cases, args.sizes, args.repeat)
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(results, fp, indent=2)
+    if args.compare:
+        with open(args.compare) as fp:
+            base = json.load(fp)
+        slower = compare(base, results, args.tolerance)
+        for case, size, ratio in slower:
+            print('{} ({}) is {:.0%} slower'.format(case, size, ratio - 1), file=sys.stderr)
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -8,10 +8,69 @@ from datetime import datetime, timedelta, date, timezone
 from abc import ABC, abstractmethod
 import json
 import base64
+import threading
+from urllib.parse import urlsplit
 import bizdays
 
 import pytz
 import requests
+from requests.adapters import HTTPAdapter
+
+
+class SessionPool:
+    """Keeps one requests.Session per host so that downloads from the same
+    host reuse their connections (keep-alive) instead of opening a new one
+    each time. `pool_maxsize` is the number of connections kept per host and
+    `session_factory` creates the sessions, it can be replaced in tests."""
+
+    def __init__(self, pool_maxsize=10, max_retries=0, session_factory=requests.Session):
+        self.pool_maxsize = pool_maxsize
+        self.max_retries = max_retries
+        self.session_factory = session_factory
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def session(self, url):
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                session = self.session_factory()
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=self.pool_maxsize,
+                    max_retries=self.max_retries,
+                )
+                session.mount("{}://{}".format(*key), adapter)
+                self._sessions[key] = session
+        return session
+
+    def get(self, url, **kwargs):
+        return self.session(url).get(url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.session(url).post(url, **kwargs)
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+
+_session_pool = SessionPool()
+
+
+def get_session_pool():
+    return _session_pool
+
+
+def set_session_pool(pool):
+    """Replaces the SessionPool used by default and returns the previous one."""
+    global _session_pool
+    previous, _session_pool = _session_pool, pool
+    return previous
 
 
 def downloader_factory(**kwargs):
@@ -107,9 +166,14 @@ def save_file_to_temp_folder(attrs, fname, tfile):
 
 
 class SingleDownloader(ABC):
-    def __init__(self, **kwargs):
+    def __init__(self, session_pool=None, **kwargs):
         self.attrs = kwargs
         self._url = None
+        self._session_pool = session_pool
+
+    @property
+    def sessions(self):
+        return self._session_pool or get_session_pool()
 
     @property
     def now(self):
@@ -143,7 +207,9 @@ class RawURLDownloader(SingleDownloader):
     def download(self, refdate=None):
         self._url = self.attrs["url"]
         verify_ssl = self.attrs.get("verify_ssl", True)
-        _, tfile, status_code, res = download_url(self._url, verify_ssl=verify_ssl)
+        _, tfile, status_code, res = download_url(
+            self._url, verify_ssl=verify_ssl, sessions=self.sessions
+        )
         if status_code != 200:
             return None, None, status_code, None
         fname = self.get_fname(None, self.now)
@@ -158,7 +224,9 @@ class FormatDateURLDownloader(SingleDownloader):
         logging.debug("TIMEDELTA %s", self.attrs.get("timedelta", 0))
         self._url = refdate.strftime(self.attrs["url"])
         verify_ssl = self.attrs.get("verify_ssl", True)
-        _, tfile, status_code, res = download_url(self._url, verify_ssl=verify_ssl)
+        _, tfile, status_code, res = download_url(
+            self._url, verify_ssl=verify_ssl, sessions=self.sessions
+        )
         if status_code != 200:
             return None, None, status_code, refdate
         if self.attrs.get("use_filename"):
@@ -206,7 +274,9 @@ class StaticFileDownloader(SingleDownloader):
     def download(self, refdate=None):
         self._url = self.get_url(refdate)
         verify_ssl = self.attrs.get("verify_ssl", True)
-        _, tfile, status_code, res = download_url(self._url, verify_ssl=verify_ssl)
+        _, tfile, status_code, res = download_url(
+            self._url, verify_ssl=verify_ssl, sessions=self.sessions
+        )
         refdate = datetime.strptime(
             res.headers["last-modified"], "%a, %d %b %Y %H:%M:%S %Z"
         )
@@ -236,7 +306,9 @@ class StaticZipFileDownloader(SingleDownloader):
     def download(self, refdate=None):
         self._url = self.get_url(refdate)
         verify_ssl = self.attrs.get("verify_ssl", True)
-        _, tfile, status_code, res = download_url(self._url, verify_ssl=verify_ssl)
+        _, tfile, status_code, res = download_url(
+            self._url, verify_ssl=verify_ssl, sessions=self.sessions
+        )
         refdate = datetime.strptime(
             res.headers["last-modified"], "%a, %d %b %Y %H:%M:%S %Z"
         )
@@ -313,7 +385,9 @@ class PreparedURLDownloader(SingleDownloader):
 
     def _download_unzip_historical_data(self, url):
         verify_ssl = self.attrs.get("verify_ssl", True)
-        _, temp, status_code, res = download_url(url, verify_ssl=verify_ssl)
+        _, temp, status_code, res = download_url(
+            url, verify_ssl=verify_ssl, sessions=self.sessions
+        )
         if status_code != 200:
             return None, None, status_code
         zf = zipfile.ZipFile(temp)
@@ -340,7 +414,7 @@ class B3FilesURLDownloader(SingleDownloader):
         logging.info("refdate %s", refdate)
         date = refdate.strftime("%Y-%m-%d")
         url = f"https://arquivos.b3.com.br/api/download/requestname?fileName={filename}&date={date}&recaptchaToken="
-        res = requests.get(url)
+        res = self.sessions.get(url)
         msg = "status_code = {} url = {}".format(res.status_code, url)
         logg = logging.warn if res.status_code != 200 else logging.info
         logg(msg)
@@ -349,7 +423,9 @@ class B3FilesURLDownloader(SingleDownloader):
         ret = res.json()
         url = f'https://arquivos.b3.com.br/api/download/?token={ret["token"]}'
         verify_ssl = self.attrs.get("verify_ssl", True)
-        fname, temp_file, status_code, res = download_url(url, verify_ssl=verify_ssl)
+        fname, temp_file, status_code, res = download_url(
+            url, verify_ssl=verify_ssl, sessions=self.sessions
+        )
         if res.status_code != 200:
             return None, None, res.status_code, refdate
         f_fname = self.get_fname(fname, refdate)
@@ -378,7 +454,9 @@ class B3StockIndexInfoDownloader(SingleDownloader):
         params_enc = base64.encodebytes(bytes(params, "utf8")).decode("utf8").strip()
         url = f"https://sistemaswebb3-listados.b3.com.br/indexProxy/indexCall/GetStockIndex/{params_enc}"
         verify_ssl = self.attrs.get("verify_ssl", True)
-        fname, temp_file, status_code, res = download_url(url, verify_ssl=verify_ssl)
+        fname, temp_file, status_code, res = download_url(
+            url, verify_ssl=verify_ssl, sessions=self.sessions
+        )
         if res.status_code != 200:
             return None, None, res.status_code, refdate
         f_fname = self.get_fname(None, self.now)
@@ -407,7 +485,7 @@ class VnaAnbimaURLDownloader(SingleDownloader):
             "Dt_Ref_Ver": refdate.strftime("%Y%m%d"),
             "Inicio": refdate.strftime("%d/%m/%Y"),
         }
-        res = requests.post(url, params=body)
+        res = self.sessions.post(url, params=body)
         msg = "status_code = {} url = {}".format(res.status_code, url)
         logg = logging.warn if res.status_code != 200 else logging.info
         logg(msg)
@@ -435,8 +513,9 @@ class VnaAnbimaURLDownloader(SingleDownloader):
         return refdate
 
 
-def download_url(url, verify_ssl=True):
-    res = requests.get(url, verify=verify_ssl)
+def download_url(url, verify_ssl=True, sessions=None):
+    sessions = sessions or get_session_pool()
+    res = sessions.get(url, verify=verify_ssl)
     msg = "status_code = {} url = {}".format(res.status_code, url)
     logg = logging.warn if res.status_code != 200 else logging.info
     logg(msg)
@@ -1,15 +1,32 @@
 
+import io
 import os
 import re
 import zipfile
+import mmap
+import pickle
 import logging
+import functools
+import itertools
 from datetime import datetime
-from collections import OrderedDict
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
 
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
 from regexparser import PortugueseRulesParser, GenericParser
 
 
 class PortugueseRulesParser2(PortugueseRulesParser):
+    # the regex parsers are closures, they are built again when unpickled
+    def __getstate__(self):
+        return {}
+
+    def __setstate__(self, state):
+        self.__init__()
+
     def parseInteger(self, text, match):
         r'^\d+$'
         return int(match.group())
@@ -35,8 +52,121 @@ class PortugueseRulesParser2(PortugueseRulesParser):
         return '{}-{}-{}'.format(match.group(1), match.group(2), match.group(3))
 
 
-def convert_csv_to_dict(file, sep=';', encoding='utf-8'):
+def _date_ptbr(text):
+    if len(text) != 10 or text[2] != '/' or text[5] != '/':
+        raise ValueError(text)
+    return '{}-{}-{}'.format(text[6:], text[3:5], text[:2])
+
+
+def _date_yyyymmdd(text):
+    if len(text) != 8 or not text.isdigit():
+        raise ValueError(text)
+    return '{}-{}-{}'.format(text[:4], text[4:6], text[6:])
+
+
+def _natural(text):
+    if not text.isdigit():
+        raise ValueError(text)
+    return int(text)
+
+
+def _decimal_ptbr(text):
+    # cells without decimals are left to the fallback, that keeps integers
+    if ',' not in text:
+        raise ValueError(text)
+    return float(text.replace('.', '').replace(',', '.'))
+
+
+def _decimal(text):
+    if '.' not in text:
+        raise ValueError(text)
+    return float(text.replace(',', ''))
+
+
+class TypedColumns:
+    '''Converts columns of texts with one specialized converter per column,
+    instead of trying the rules of a TextParser on every cell.
+
+    The type of a column is declared in `types`, by column key, or inferred
+    from a sample of its values among the `candidates` types, tried in
+    order. Empty, 'N/D' and '--' cells are None. Cells that do not fit the
+    type of their column, and columns of mixed types, are converted by the
+    `fallback` function, so integer cells of decimal columns are converted
+    by the fallback too and the result is the same of the fallback.
+    '''
+    # name: (pattern of the inference, converter)
+    TYPES = {
+        'date_YYYYMMDD': (r'^\d{8}$', _date_yyyymmdd),
+        'date_ptBR': (r'^\d{2}/\d{2}/\d{4}$', _date_ptbr),
+        'integer': (r'^-?\d+$', int),
+        'natural': (r'^\d+$', _natural),
+        'decimal_ptBR': (r'^-?(\d{1,3}(\.\d{3})+|\d+),\d+$', _decimal_ptbr),
+        'decimal': (r'^-?(\d{1,3}(,\d{3})+|\d+)\.\d+$', _decimal),
+    }
+    # candidates of the PortugueseRulesParser2 and GenericParser rules
+    PTBR = ['date_YYYYMMDD', 'date_ptBR', 'natural', 'decimal_ptBR']
+    GENERIC = ['integer', 'decimal']
+    NULLS = frozenset(['', 'N/D', '--'])
+
+    def __init__(self, candidates, fallback, types=None, sample_size=100):
+        self.candidates = [(name, re.compile(self.TYPES[name][0])) for name in candidates]
+        self.fallback = fallback
+        self.types = dict(types or {})
+        self.sample_size = sample_size
+
+    def infer(self, values):
+        '''Returns the type of the values, integers mixed with decimals are
+        decimals, or None if they are of mixed types.'''
+        found = set()
+        for text in itertools.islice(values, self.sample_size):
+            text = text.strip()
+            if text in self.NULLS:
+                continue
+            name = next((name for name, regex in self.candidates if regex.match(text)), None)
+            if name is None:
+                return None
+            found.add(name)
+        if len(found) == 2 and found & {'integer', 'natural'}:
+            found -= {'integer', 'natural'}
+            if found <= {'decimal_ptBR', 'decimal'}:
+                return found.pop()
+            return None
+        return found.pop() if len(found) == 1 else None
+
+    def converter(self, name):
+        '''Returns the function that converts a cell of the type `name`.'''
+        fallback = self.fallback
+        if name is None:
+            return fallback
+        fun = self.TYPES[name][1]
+        nulls = self.NULLS
+
+        def convert(text):
+            stripped = text.strip()
+            if stripped in nulls:
+                return None
+            try:
+                return fun(stripped)
+            except ValueError:
+                return fallback(text)
+        return convert
+
+    def column_converter(self, key, values):
+        '''Returns the converter of the column `key` given a sample of its
+        values, the inferred type is kept in `types`.'''
+        if key not in self.types:
+            self.types[key] = self.infer(values)
+        return self.converter(self.types[key])
+
+
+def convert_csv_to_dict(file, sep=';', encoding='utf-8', typed=False):
+    '''Yields the lines of a CSV file as dicts of parsed values. With
+    `typed` the type of each column is inferred from the first lines, see
+    `TypedColumns`.'''
     parser = GenericParser()
+    if typed:
+        yield from _convert_csv_to_dict_typed(file, sep, encoding, parser)
+        return
     for ix, line in enumerate(file):
         line = line.decode(encoding).strip()
         if ix == 0:
@@ -45,6 +175,22 @@ def convert_csv_to_dict(file, sep=';', encoding='utf-8'):
         yield dict(zip(hdr, vals))
 
 
+def _convert_csv_to_dict_typed(file, sep, encoding, parser):
+    lines = (line.decode(encoding).strip() for line in file)
+    line = next(lines, None)
+    if line is None:
+        return
+    hdr = [field.lower() for field in line.split(sep)]
+    yield dict(zip(hdr, [parser.parse(val) for val in line.split(sep)]))
+    rows = (line.split(sep) for line in lines)
+    typed = TypedColumns(TypedColumns.GENERIC, parser.parse)
+    sample = list(itertools.islice(rows, typed.sample_size))
+    converters = [typed.column_converter(ix, [row[ix] for row in sample if len(row) > ix])
+                  for ix in range(len(hdr))]
+    for row in itertools.chain(sample, rows):
+        yield dict(zip(hdr, [convert(val) for convert, val in zip(converters, row)]))
+
+
 def read_fwf(con, widths, colnames=None, skip=0, parse_fun=lambda x: x):
     '''read and parse fixed width field files'''
     colpositions = []
@@ -113,36 +259,366 @@ def unzip_file_to(temp, dest, index=-1):
     return os.path.join(dest, name)
 
 
+def is_path(src):
+    return isinstance(src, (str, os.PathLike))
+
+
+@contextmanager
+def open_input(src, mode='rb', encoding=None):
+    '''Opens a file name, bytes or a file object to be read by a parser.
+
+    File objects are not closed, binary ones are decoded with `encoding`
+    when opened in text mode.
+    '''
+    if is_path(src):
+        with open(src, mode, encoding=encoding) as fp:
+            yield fp
+        return
+    if isinstance(src, (bytes, bytearray, memoryview)):
+        src = io.BytesIO(src)
+    text = isinstance(src.read(0), str)
+    if 'b' in mode:
+        if text:
+            raise TypeError('A binary file object is required')
+        yield src
+    elif text:
+        yield src
+    else:
+        fp = io.TextIOWrapper(src, encoding=encoding)
+        try:
+            yield fp
+        finally:
+            fp.detach()
+
+
+@contextmanager
+def open_zip_member(fname, member=-1):
+    '''Opens a member of a zip file as a binary stream, nothing is written
+    to disk.
+
+    `member` is an index or a name in the archive or a tuple given by
+    `list_zip_members`. Self-extracting files, like the TaxaSwap .ex_
+    files, are opened as zip files.
+
+    >>> with open_zip_member('TS190910.ex_') as fp:
+    ...     x = TaxaSwap(fp)
+    '''
+    if isinstance(member, tuple):
+        if len(member) > 1:
+            fname = read_zip_member(fname, member[:-1])
+        member = member[-1]
+    if isinstance(fname, (bytes, bytearray)):
+        fname = io.BytesIO(fname)
+    with zipfile.ZipFile(fname) as zf:
+        if isinstance(member, int):
+            member = zf.namelist()[member]
+        logging.info('zipped file %s', member)
+        with zf.open(member) as fp:
+            yield fp
+
+
+def list_zip_members(fname):
+    '''Returns the members of a zip file, in archive order, as tuples of
+    names with the members of inner zip files expanded.'''
+    with zipfile.ZipFile(fname) as zf:
+        return _list_zip_members(zf, ())
+
+
+def _list_zip_members(zf, parent):
+    members = []
+    for info in zf.infolist():
+        if info.is_dir():
+            continue
+        member = parent + (info.filename,)
+        if info.filename.lower().endswith('.zip'):
+            with zipfile.ZipFile(io.BytesIO(zf.read(info))) as inner:
+                members.extend(_list_zip_members(inner, member))
+        else:
+            members.append(member)
+    return members
+
+
+def read_zip_member(fname, member):
+    '''Returns the content of a member given by `list_zip_members`.'''
+    content = fname
+    for name in member:
+        with zipfile.ZipFile(content if content is fname else io.BytesIO(content)) as zf:
+            content = zf.read(name)
+    return content
+
+
+def clear_element(elem):
+    '''Frees an element parsed by etree.iterparse and everything before it
+    in the document, its ancestors are kept.'''
+    elem.clear(keep_tail=True)
+    for node in itertools.chain([elem], elem.iterancestors()):
+        while node.getprevious() is not None:
+            del node.getparent()[0]
+
+
+class PathExtractor:
+    '''Extracts the text of many paths of an element in one traversal.
+
+    `paths` maps names to paths like 'FinInstrmId/OthrId/Id' of elements in
+    the `ns` namespace. The paths are compiled into a trie of tags, so each
+    record walks only the branches of the element that lead to a path, once.
+    As in `findall(path)[0]` the first match in document order is taken.
+    With `strip` the texts are stripped and with `keep_missing` the names
+    of paths not found are set to None.
+    '''
+
+    def __init__(self, paths, ns=None, strip=False, keep_missing=False):
+        self.names = list(paths)
+        self.strip = strip
+        self.keep_missing = keep_missing
+        # tag: (names of the paths ending at tag, trie of the children)
+        self._trie = {}
+        for name, path in paths.items():
+            trie = self._trie
+            tags = ['{{{}}}{}'.format(ns, t) if ns else t for t in path.split('/')]
+            for tag in tags[:-1]:
+                trie = trie.setdefault(tag, ([], {}))[1]
+            trie.setdefault(tags[-1], ([], {}))[0].append(name)
+
+    def extract(self, node, data=None):
+        '''Adds the texts found under `node` to `data`, in the order of the
+        paths, and returns it.'''
+        found = {}
+        self._walk(node, self._trie, found)
+        data = {} if data is None else data
+        for name in self.names:
+            if name in found:
+                text = found[name]
+                data[name] = text.strip() if self.strip and text is not None else text
+            elif self.keep_missing:
+                data[name] = None
+        return data
+
+    def _walk(self, elm, trie, found):
+        for child in elm:
+            entry = trie.get(child.tag)
+            if entry is None:
+                continue
+            for name in entry[0]:
+                if name not in found:
+                    found[name] = child.text
+            if entry[1]:
+                self._walk(child, entry[1], found)
+
+
+# bulk converters of columns of texts by dtype name
+COLUMN_CONVERTERS = {
+    'float64': lambda x: pd.to_numeric(x).astype('float64'),
+    'Int64': lambda x: pd.to_numeric(x).astype('Int64'),
+    'datetime64[ns]': lambda x: pd.to_datetime(x, format='ISO8601'),
+    'category': lambda x: x.astype('category'),
+    'object': lambda x: x,
+}
+
+
+def records_to_frame(records, dtypes):
+    '''Builds a DataFrame with the `dtypes` columns of a list of dicts of
+    texts, each column is converted at once by its dtype converter.'''
+    df = pd.DataFrame.from_records(records, columns=list(dtypes))
+    for name, dtype in dtypes.items():
+        df[name] = COLUMN_CONVERTERS[dtype](df[name])
+    return df
+
+
+def _char_column(chars, width):
+    return np.ascontiguousarray(chars).view('S{}'.format(width)).ravel()
+
+
+def _digits(chars):
+    digits = chars.astype(np.int64) - 48
+    if digits.size and (digits.min() < 0 or digits.max() > 9):
+        return None
+    return digits
+
+
+CacheInfo = namedtuple('CacheInfo', 'hits misses maxsize currsize')
+
+
 class Field:
     _counter = 0
 
-    def __init__(self, width):
+    def __init__(self, width, cache_size=0):
         self.width = width
+        self.cache_size = cache_size
+        self._caches = {}
         self._counter_val = Field._counter
         Field._counter += 1
 
     def parse(self, text):
         return text
 
+    def parse_bytes(self, raw, encoding='UTF8'):
+        return self.parse(raw.decode(encoding))
+
+    def parse_source(self, text, raw=False):
+        '''Returns an expression equivalent to `parse(text)` to be inlined in
+        compiled row parsers, or None if `parse` must be called. With `raw`
+        the text is a bytes object.'''
+        if type(self).parse is not Field.parse or self.cache_size:
+            return None
+        return '{}.decode(encoding)'.format(text) if raw else text
+
+    def converter(self, raw=False, encoding='UTF8'):
+        '''Returns the function used by compiled row parsers to convert the
+        field text (bytes with `raw`). With `cache_size` the conversions are
+        memoized in a LRU cache of that size.'''
+        if raw:
+            convert = functools.partial(self.parse_bytes, encoding=encoding)
+        else:
+            convert = self.parse
+        if not self.cache_size:
+            return convert
+        key = (raw, encoding if raw else None)
+        if key not in self._caches:
+            self._caches[key] = functools.lru_cache(maxsize=self.cache_size)(convert)
+        return self._caches[key]
+
+    def cache_info(self):
+        '''Returns the hits and misses of the conversion caches or None.'''
+        if not self.cache_size:
+            return None
+        infos = [c.cache_info() for c in self._caches.values()]
+        return CacheInfo(sum(i.hits for i in infos), sum(i.misses for i in infos),
+                         self.cache_size, sum(i.currsize for i in infos))
+
+    def cache_clear(self):
+        for cache in self._caches.values():
+            cache.cache_clear()
+
+    def parse_column(self, chars, encoding='UTF8'):
+        '''Parses a (rows, width) uint8 array of raw bytes at once.'''
+        col = np.char.strip(_char_column(chars, self.width))
+        cats, codes = np.unique(col, return_inverse=True)
+        cats = [c.decode(encoding) for c in cats]
+        return pd.Categorical.from_codes(codes.ravel(), cats)
+
 
 class DateField(Field):
-    def __init__(self, width, format):
-        super(DateField, self).__init__(width)
+    def __init__(self, width, format, cache_size=4096):
+        # dates repeat a lot (reference dates, maturities), strptime is
+        # called once per distinct value
+        super(DateField, self).__init__(width, cache_size=cache_size)
         self.format = format
 
     def parse(self, text):
         return datetime.strptime(text, self.format)
 
+    def parse_bytes(self, raw, encoding='UTF8'):
+        if self.format == '%Y%m%d' and len(raw) == 8 and raw.isdigit() and \
+                type(self).parse is DateField.parse:
+            return datetime(int(raw[:4]), int(raw[4:6]), int(raw[6:]))
+        return self.parse(raw.decode(encoding))
+
+    def parse_column(self, chars, encoding='UTF8'):
+        # invalid dates raise ValueError, like parse, so that the lines are
+        # handled by on_error as malformed
+        digits = _digits(chars) if self.format == '%Y%m%d' else None
+        if digits is None:
+            col = np.char.strip(_char_column(chars, self.width))
+            col = pd.Series(np.char.decode(col, encoding))
+            dates = pd.to_datetime(col, format=self.format, errors='coerce').values
+            if np.isnat(dates).any():
+                raise ValueError('invalid dates in column')
+            return dates
+        year = digits[:, :4] @ np.array([1000, 100, 10, 1])
+        month = digits[:, 4:6] @ np.array([10, 1])
+        day = digits[:, 6:8] @ np.array([10, 1])
+        dates = ((year - 1970).astype('M8[Y]') + (month - 1).astype('m8[M]')).astype('M8[D]')
+        dates = dates + (day - 1).astype('m8[D]')
+        # invalid dates: zero filled fields, 31st of a 30 days month
+        invalid = (month < 1) | (month > 12) | (day < 1) | \
+            (dates.astype('M8[M]') != (year - 1970).astype('M8[Y]') + (month - 1).astype('m8[M]'))
+        if invalid.any():
+            raise ValueError('invalid dates in column')
+        return dates
+
 
 class NumericField(Field):
-    def __init__(self, width, dec=0, sign=''):
-        super(NumericField, self).__init__(width)
+    def __init__(self, width, dec=0, sign='', cache_size=0):
+        super(NumericField, self).__init__(width, cache_size=cache_size)
         self.dec = dec
         self.sign = sign
+        self._scale = 10**int(dec)
+        self._negative = sign == '-'
 
     def parse(self, text):
-        text = self.sign + text
-        return float(text)/(10**int(self.dec))
+        value = float(text)/self._scale
+        return -value if self._negative else value
+
+    def parse_source(self, text, raw=False):
+        # float() also converts bytes
+        if type(self).parse is not NumericField.parse or self.cache_size:
+            return None
+        sign = '-' if self._negative else ''
+        return '{}float({})/{}'.format(sign, text, self._scale)
+
+    def parse_column(self, chars, encoding='UTF8'):
+        digits = _digits(chars) if self.width <= 18 else None
+        if digits is None:
+            col = np.char.strip(_char_column(chars, self.width))
+            return np.array([self.parse(x.decode(encoding)) for x in col], dtype=np.float64)
+        values = digits @ (10 ** np.arange(self.width - 1, -1, -1, dtype=np.int64))
+        if self.sign == '-':
+            values = -values
+        if int(self.dec):
+            return values / (10**int(self.dec))
+        return values
+
+
+def _literal_prefix(pattern):
+    '''Returns the literal text matched by an anchored pattern like `^01`
+    or None if the pattern uses any regex construction.'''
+    m = re.match(r'^\^([\w ]*)$', pattern)
+    return m.group(1) if m else None
+
+
+def _compile_row_parser(fields, raw=False, encoding='UTF8', columns=None, where=None):
+    '''Generates a function that parses a line into a dict, with the slices
+    of all fields and, where possible, their converters inlined. With `raw`
+    the function parses bytes lines decoded with `encoding`.
+
+    Only the fields in `columns` are parsed and the function returns None
+    for lines whose raw fields do not satisfy the `where` conditions.
+    '''
+    env = {'encoding': encoding}
+    chunks = {}
+    x = 0
+    for name, field in fields.items():
+        chunks[name] = 'line[{}:{}].strip()'.format(x, x + field.width)
+        x = x + field.width
+    for name in itertools.chain(columns or [], where or {}):
+        if name not in fields:
+            raise ValueError('Unknown field {}'.format(name))
+    checks = []
+    for ix, (name, cond) in enumerate((where or {}).items()):
+        key = 'where_{}'.format(ix)
+        if callable(cond):
+            env[key] = cond
+            text = '{}.decode(encoding)'.format(chunks[name]) if raw else chunks[name]
+            checks.append('not {}({})'.format(key, text))
+        elif isinstance(cond, str):
+            env[key] = cond.encode(encoding) if raw else cond
+            checks.append('{} != {}'.format(chunks[name], key))
+        else:
+            env[key] = frozenset(c.encode(encoding) if raw else c for c in cond)
+            checks.append('{} not in {}'.format(chunks[name], key))
+    body = []
+    for ix, name in enumerate(columns or fields):
+        source = fields[name].parse_source(chunks[name], raw=raw)
+        if source is None:
+            env['parse_{}'.format(ix)] = fields[name].converter(raw=raw, encoding=encoding)
+            source = 'parse_{}({})'.format(ix, chunks[name])
+        body.append('        {!r}: {},'.format(name, source))
+    code = 'def parse_line(line):\n'
+    code += ''.join('    if {}:\n        return None\n'.format(c) for c in checks)
+    code += '    return {{\n{}\n    }}\n'.format('\n'.join(body))
+    exec(code, env)
+    return env['parse_line']
 
 
 class FWFRowMeta(type):
@@ -161,12 +637,14 @@ class FWFRowMeta(type):
             ((k, v) for k, v in attrs.items() if isinstance(v, Field)),
             key=lambda x: x[1]._counter_val)
         cls._fields.update(OrderedDict(sorted_fields))
+        cls.parse_line = staticmethod(_compile_row_parser(cls._fields))
         return cls
 
 
 class FWFRow(metaclass=FWFRowMeta):
     def __init__(self):
         self.pattern = re.compile(self._pattern)
+        self._bytes_parsers = {}
         self.names = list(self._fields.keys())
         self.widths = [self._fields[n].width for n in self._fields]
         self.row_len = sum(self.widths)
@@ -181,6 +659,20 @@ class FWFRow(metaclass=FWFRowMeta):
     def __len__(self):
         return self.row_len
 
+    def bytes_parser(self, encoding):
+        '''Returns the compiled parser of bytes lines for `encoding`.'''
+        if encoding not in self._bytes_parsers:
+            self._bytes_parsers[encoding] = _compile_row_parser(
+                self._fields, raw=True, encoding=encoding)
+        return self._bytes_parsers[encoding]
+
+    def compile(self, columns=None, where=None, raw=False, encoding='UTF8'):
+        '''Returns a parser of the `columns` of the lines that satisfy the
+        `where` conditions, see `FWFFile`.'''
+        if columns is None and where is None:
+            return self.bytes_parser(encoding) if raw else self.parse_line
+        return _compile_row_parser(self._fields, raw, encoding, columns, where)
+
 
 class FWFFileMeta(type):
     """The metaclass for the FWFRow class. We use the metaclass to sort of
@@ -194,25 +686,86 @@ class FWFFileMeta(type):
         cls = type.__new__(meta, name, bases, attrs)
         cls._rows = [(k, v) for k, v in attrs.items() if isinstance(v, FWFRow)]
         cls._buckets = dict((r[0], []) for r in cls._rows)
+        # rows with a literal record type prefix (like ^01) are dispatched
+        # with a dict lookup, the others are matched with their regexes
+        prefixes = [(_literal_prefix(r[1]._pattern), r) for r in cls._rows]
+        lengths = set(len(p) for p, r in prefixes if p)
+        cls._prefix_len = lengths.pop() if len(lengths) == 1 else 0
+        cls._dispatch = dict((p, r) for p, r in prefixes
+                             if p and len(p) == cls._prefix_len)
+        cls._fallback = [r for p, r in prefixes if p not in cls._dispatch]
         return cls
 
 
+class FWFStats:
+    '''Counters of a FWF file parsing and the lines rejected by its policy.'''
+
+    def __init__(self):
+        self.lines = 0
+        self.parsed = 0
+        self.filtered = 0
+        self.unmatched = 0
+        self.malformed = 0
+        # (line number, line, reason) of the lines rejected with 'collect'
+        self.rejected = []
+
+    def reject(self, policy, lineno, line, reason):
+        if policy == 'raise':
+            raise ValueError('Line {} is {}: {!r}'.format(lineno, reason, line))
+        setattr(self, reason, getattr(self, reason) + 1)
+        if policy == 'collect':
+            self.rejected.append((lineno, line, reason))
+
+    def merge(self, other, policy, offset=0):
+        '''Adds the counters of a chunk parsed with the 'collect' policy whose
+        first line comes `offset` lines after the start of the file.'''
+        for lineno, line, reason in other.rejected:
+            self.reject(policy, lineno + offset, line, reason)
+        self.lines += other.lines
+        self.parsed += other.parsed
+        self.filtered += other.filtered
+
+
 class FWFFile(metaclass=FWFFileMeta):
     skip_row = 0
 
-    def __init__(self, fname, encoding='UTF8'):
-        with open(fname, 'r', encoding=encoding) as fp:
-            for ix, line in enumerate(fp):
-                if ix < self.skip_row:
-                    continue
-                row_name, row_template = self._get_row_template(line)
-                # TODO: define policy to discard unmatched lines and
-                #       lines with parsing errors
-                # if len(line) < len(row_template):
-                #     continue
-                fields = [dx[2](line[dx[0]:dx[1]].strip()) for dx in row_template.colpositions]
-                obj = dict((k, v) for k, v in zip(row_template.names, fields))
-                self._buckets[row_name].append(obj)
+    def __init__(self, fname, encoding='UTF8', as_frame=False, on_error='raise', workers=None,
+                 reader='text', columns=None, where=None):
+        '''`on_error` is the policy for unmatched or malformed lines: 'raise'
+        an error, 'skip' them or 'collect' them into `stats.rejected`.
+
+        With `workers` > 1 the file is split into line aligned chunks that
+        are parsed in a pool of processes, the result is the same of the
+        serial parsing.
+
+        With `reader='mmap'` the file is memory mapped and the fields are
+        sliced from the raw bytes, only text fields are decoded.
+
+        `columns` maps row names to the list of fields to parse and `where`
+        maps row names to conditions on the stripped raw text of fields,
+        like {'data': {'cod_bdi': '02'}}. A condition is a value, a
+        collection of values or a function. Rows that fail a condition are
+        dropped before any field is converted. With `workers` > 1 the
+        functions are sent to the worker processes, so they must be
+        picklable (module level functions, not lambdas).
+        '''
+        self.stats = FWFStats()
+        if workers and workers > 1:
+            if not is_path(fname):
+                raise ValueError('Parallel parsing needs a file name')
+            self._buckets = self._parse_parallel(fname, encoding, as_frame, on_error,
+                                                 self.stats, workers, reader, columns, where)
+            return
+        if as_frame:
+            self._buckets = self.read_frames(fname, encoding=encoding, on_error=on_error,
+                                             stats=self.stats, reader=reader,
+                                             columns=columns, where=where)
+            return
+        self._buckets = dict((r[0], []) for r in self._rows)
+        for row_name, obj in self.iter(fname, encoding=encoding, on_error=on_error,
+                                       stats=self.stats, reader=reader,
+                                       columns=columns, where=where):
+            self._buckets[row_name].append(obj)
 
     def __getattribute__(self, name: str):
         buckets = super(FWFFile, self).__getattribute__('_buckets')
@@ -221,13 +774,343 @@ class FWFFile(metaclass=FWFFileMeta):
         else:
             return super(FWFFile, self).__getattribute__(name)
 
-    def _get_row_template(self, line):
-        for row in self._rows:
-            m = row[1].pattern.match(line)
-            if m:
+    @classmethod
+    def iter(cls, fname, encoding='UTF8', on_error='raise', stats=None, reader='text',
+             columns=None, where=None):
+        '''Lazily yields (row_name, record) pairs in file order.
+
+        Nothing is kept in memory but the line being parsed, so the peak
+        memory does not depend on the file size. Pass a FWFStats as `stats`
+        to get the counters of the lines parsed and rejected.
+        '''
+        stats = FWFStats() if stats is None else stats
+        # empty files can not be mapped
+        if reader == 'mmap':
+            with _raw_input(fname) as fp:
+                lines = itertools.islice(iter(fp.readline, b''), cls.skip_row, None)
+                yield from cls._iter_bytes_lines(lines, encoding, on_error, stats,
+                                                 cls.skip_row, columns, where)
+            return
+        with open_input(fname, 'r', encoding=encoding) as fp:
+            lines = itertools.islice(fp, cls.skip_row, None)
+            yield from cls._iter_lines(lines, on_error, stats, cls.skip_row, columns, where)
+
+    @classmethod
+    def _row_parsers(cls, columns, where, raw=False, encoding='UTF8'):
+        columns = columns or {}
+        where = where or {}
+        names = [r[0] for r in cls._rows]
+        for row_name in itertools.chain(columns, where):
+            if row_name not in names:
+                raise ValueError('Unknown row {}'.format(row_name))
+        return dict((r[0], r[1].compile(columns.get(r[0]), where.get(r[0]), raw, encoding))
+                    for r in cls._rows)
+
+    @classmethod
+    def _iter_lines(cls, lines, on_error, stats, skip=0, columns=None, where=None):
+        parsers = cls._row_parsers(columns, where)
+        for ix, line in enumerate(lines, skip + 1):
+            stats.lines += 1
+            row = cls._get_row_template(line)
+            if row is None:
+                stats.reject(on_error, ix, line.rstrip('\r\n'), 'unmatched')
+                continue
+            # lines shorter than their row are malformed, as in read_frames
+            text = line.rstrip('\r\n')
+            try:
+                if len(text) < row[1].row_len:
+                    raise ValueError(text)
+                obj = parsers[row[0]](line)
+            except ValueError:
+                stats.reject(on_error, ix, text, 'malformed')
+                continue
+            if obj is None:
+                stats.filtered += 1
+                continue
+            stats.parsed += 1
+            yield row[0], obj
+
+    @classmethod
+    def _iter_bytes_lines(cls, lines, encoding, on_error, stats, skip=0, columns=None,
+                          where=None):
+        parsers = cls._row_parsers(columns, where, raw=True, encoding=encoding)
+        dispatch = dict((k.encode(encoding), (r[0], parsers[r[0]], r[1].row_len))
+                        for k, r in cls._dispatch.items())
+        n = cls._prefix_len
+        for ix, line in enumerate(lines, skip + 1):
+            stats.lines += 1
+            row = dispatch.get(line[:n])
+            if row is None:
+                row = cls._get_row_template(line.decode(encoding))
+                if row is None:
+                    stats.reject(on_error, ix, line.decode(encoding).rstrip('\r\n'), 'unmatched')
+                    continue
+                row = (row[0], parsers[row[0]], row[1].row_len)
+            # lines shorter than their row are malformed, in bytes as in read_frames
+            try:
+                if len(line.rstrip(b'\r\n')) < row[2]:
+                    raise ValueError(line)
+                obj = row[1](line)
+            except ValueError:
+                stats.reject(on_error, ix, line.decode(encoding).rstrip('\r\n'), 'malformed')
+                continue
+            if obj is None:
+                stats.filtered += 1
+                continue
+            stats.parsed += 1
+            yield row[0], obj
+
+    @classmethod
+    def read_frames(cls, fname, encoding='UTF8', on_error='raise', stats=None, reader='text',
+                    columns=None, where=None):
+        '''Parses the whole file into one DataFrame per row type.
+
+        The raw bytes are sliced into columns and each column is converted
+        at once by its field's `parse_column`, no Python object is created
+        per line. Unmatched lines and lines shorter than their row are
+        handled by the `on_error` policy.
+        '''
+        stats = FWFStats() if stats is None else stats
+        if reader == 'mmap' and is_path(fname) and os.path.getsize(fname):
+            with _mmap_file(fname) as mm:
+                return cls._read_frames(mm, encoding, on_error, stats, cls.skip_row,
+                                        columns, where)
+        with open_input(fname) as fp:
+            content = fp.read()
+        return cls._read_frames(content, encoding, on_error, stats, cls.skip_row,
+                                columns, where)
+
+    @classmethod
+    def _read_frames(cls, content, encoding, on_error, stats, skip=0, columns=None,
+                     where=None):
+        # validates the selection and gives the parsers of malformed lines
+        parsers = cls._row_parsers(columns, where)
+        columns = columns or {}
+        where = where or {}
+        buf = np.frombuffer(content, dtype=np.uint8)
+        ends = np.flatnonzero(buf == 10)
+        if len(buf) and buf[-1] != 10:
+            ends = np.append(ends, len(buf))
+        starts = np.concatenate(([0], ends[:-1] + 1))[:len(ends)][skip:]
+        ends = ends[skip:]
+        # do not count \r of \r\n line endings
+        lengths = ends - starts - (buf[np.maximum(ends - 1, 0)] == 13)
+        row_ids = cls._match_rows(buf, starts, lengths, encoding)
+        for ix, row in enumerate(cls._rows):
+            short = (row_ids == ix) & (lengths < row[1].row_len)
+            row_ids[short] = -2
+        stats.lines += len(starts)
+        for jx in np.flatnonzero(row_ids < 0):
+            line = bytes(buf[starts[jx]:starts[jx] + lengths[jx]]).decode(encoding)
+            reason = 'unmatched' if row_ids[jx] == -1 else 'malformed'
+            stats.reject(on_error, jx + skip + 1, line, reason)
+
+        # fixed length lines can be viewed as a matrix without copying
+        stride = starts[1] - starts[0] if len(starts) > 1 else 0
+        uniform = stride > 0 and bool((np.diff(starts) == stride).all())
+        frames = {}
+        for ix, (row_name, row_template) in enumerate(cls._rows):
+            sel = np.flatnonzero(row_ids == ix)
+            if uniform:
+                lines = np.lib.stride_tricks.as_strided(
+                    buf[starts[0]:], shape=(len(starts), row_template.row_len),
+                    strides=(stride, 1), writeable=False)
+            positions = dict(zip(row_template.names, row_template.colpositions))
+
+            def _chars(sel, name):
+                a, b, _ = positions[name]
+                if uniform:
+                    return lines[sel, a:b]
+                return buf[starts[sel, None] + np.arange(a, b)]
+
+            def _columns(sel):
+                return dict((name, row_template._fields[name].parse_column(_chars(sel, name), encoding))
+                            for name in columns.get(row_name) or row_template.names)
+
+            for name, cond in where.get(row_name, {}).items():
+                mask = _where_mask(_chars(sel, name), row_template._fields[name].width,
+                                   cond, encoding)
+                stats.filtered += len(sel) - mask.sum()
+                sel = sel[mask]
+            try:
+                frame = _columns(sel)
+            except ValueError:
+                # find the malformed lines one by one and parse the others
+                valid = np.ones(len(sel), dtype=bool)
+                for kx, jx in enumerate(sel):
+                    line = bytes(buf[starts[jx]:starts[jx] + lengths[jx]]).decode(encoding)
+                    try:
+                        parsers[row_name](line)
+                    except ValueError:
+                        stats.reject(on_error, jx + skip + 1, line, 'malformed')
+                        valid[kx] = False
+                sel = sel[valid]
+                frame = _columns(sel)
+            frames[row_name] = pd.DataFrame(frame, index=pd.RangeIndex(len(sel)))
+            stats.parsed += len(sel)
+        return frames
+
+    @classmethod
+    def _parse_parallel(cls, fname, encoding, as_frame, on_error, stats, workers, reader,
+                        columns=None, where=None):
+        # a condition that can't be sent to the workers would break the pool
+        try:
+            pickle.dumps((columns, where))
+        except Exception as ex:
+            raise ValueError('columns and where must be picklable to parse with '
+                             'workers > 1: {}'.format(ex)) from ex
+        chunks = cls._chunks(fname, workers * 4)
+        executor = ProcessPoolExecutor(workers)
+        try:
+            results = executor.map(_parse_fwf_chunk, itertools.repeat(cls),
+                                   itertools.repeat(fname), chunks,
+                                   itertools.repeat(encoding), itertools.repeat(as_frame),
+                                   itertools.repeat(reader), itertools.repeat(columns),
+                                   itertools.repeat(where))
+            parts = []
+            offset = cls.skip_row
+            for result, chunk_stats in results:
+                stats.merge(chunk_stats, on_error, offset)
+                offset += chunk_stats.lines
+                parts.append(result)
+        finally:
+            executor.shutdown(cancel_futures=True)
+        if as_frame:
+            return _concat_frames(parts)
+        buckets = dict((r[0], []) for r in cls._rows)
+        for part in parts:
+            for row_name in buckets:
+                buckets[row_name].extend(part[row_name])
+        return buckets
+
+    @classmethod
+    def _chunks(cls, fname, n):
+        '''Splits the file, after the skipped rows, into about `n` byte ranges
+        that start at the beginning of a line.'''
+        with open(fname, 'rb') as fp:
+            for _ in range(cls.skip_row):
+                fp.readline()
+            start = fp.tell()
+            size = os.fstat(fp.fileno()).st_size
+            bounds = [start]
+            for k in range(1, n):
+                pos = start + (size - start) * k // n
+                if pos <= bounds[-1]:
+                    continue
+                # moves to the start of the next line unless pos already is
+                fp.seek(pos - 1)
+                fp.readline()
+                pos = fp.tell()
+                if bounds[-1] < pos < size:
+                    bounds.append(pos)
+            bounds.append(size)
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    @classmethod
+    def _match_rows(cls, buf, starts, lengths, encoding):
+        row_ids = np.full(len(starts), -1)
+        index = dict((r[0], ix) for ix, r in enumerate(cls._rows))
+        n = cls._prefix_len
+        if cls._dispatch:
+            idx = np.flatnonzero(lengths >= n)
+            keys = _char_column(buf[starts[idx, None] + np.arange(n)], n)
+            for prefix, row in cls._dispatch.items():
+                row_ids[idx[keys == prefix.encode(encoding)]] = index[row[0]]
+        if cls._fallback:
+            for jx in np.flatnonzero(row_ids < 0):
+                line = bytes(buf[starts[jx]:starts[jx] + lengths[jx]]).decode(encoding)
+                for row in cls._fallback:
+                    if row[1].pattern.match(line):
+                        row_ids[jx] = index[row[0]]
+                        break
+        return row_ids
+
+    @classmethod
+    def _get_row_template(cls, line):
+        row = cls._dispatch.get(line[:cls._prefix_len])
+        if row is not None:
+            return row
+        for row in cls._fallback:
+            if row[1].pattern.match(line):
                 return row
 
 
+def _parse_fwf_chunk(cls, fname, chunk, encoding, as_frame, reader, columns, where):
+    stats = FWFStats()
+    if reader == 'mmap':
+        # the page cache of the file is shared by all workers
+        with _mmap_file(fname) as mm:
+            if as_frame:
+                with memoryview(mm) as content:
+                    frames = cls._read_frames(content[chunk[0]:chunk[1]], encoding,
+                                              'collect', stats, 0, columns, where)
+                return frames, stats
+            mm.seek(chunk[0])
+            lines = iter(mm.readline, b'')
+            lines = itertools.takewhile(lambda line: mm.tell() <= chunk[1], lines)
+            buckets = dict((r[0], []) for r in cls._rows)
+            for row_name, obj in cls._iter_bytes_lines(lines, encoding, 'collect', stats,
+                                                       0, columns, where):
+                buckets[row_name].append(obj)
+            return buckets, stats
+    with open(fname, 'rb') as fp:
+        fp.seek(chunk[0])
+        content = fp.read(chunk[1] - chunk[0])
+    if as_frame:
+        return cls._read_frames(content, encoding, 'collect', stats, 0, columns, where), stats
+    buckets = dict((r[0], []) for r in cls._rows)
+    lines = io.TextIOWrapper(io.BytesIO(content), encoding=encoding)
+    for row_name, obj in cls._iter_lines(lines, 'collect', stats, 0, columns, where):
+        buckets[row_name].append(obj)
+    return buckets, stats
+
+
+def _where_mask(chars, width, cond, encoding):
+    '''Evaluates a `where` condition on a column of raw bytes.'''
+    col = np.char.strip(_char_column(chars, width))
+    if callable(cond):
+        values, codes = np.unique(col, return_inverse=True)
+        accepted = np.array([bool(cond(v.decode(encoding))) for v in values], dtype=bool)
+        return accepted[codes.ravel()] if len(values) else np.zeros(len(col), dtype=bool)
+    if isinstance(cond, str):
+        return col == cond.encode(encoding)
+    return np.isin(col, [c.encode(encoding) for c in cond])
+
+
+@contextmanager
+def _raw_input(fname):
+    # binary lines of a file name or file object, empty files can not be mapped
+    if is_path(fname) and os.path.getsize(fname):
+        with _mmap_file(fname) as mm:
+            yield mm
+    else:
+        with open_input(fname) as fp:
+            yield fp
+
+
+@contextmanager
+def _mmap_file(fname):
+    with open(fname, 'rb') as fp:
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            yield mm
+
+
+def _concat_frames(parts):
+    '''Concatenates the DataFrames of each row type parsed in chunks.'''
+    frames = {}
+    for row_name in parts[0]:
+        dfs = [part[row_name] for part in parts]
+        columns = {}
+        for name in dfs[0].columns:
+            if isinstance(dfs[0][name].dtype, pd.CategoricalDtype):
+                columns[name] = union_categoricals([df[name].values for df in dfs],
+                                                   sort_categories=True)
+            else:
+                columns[name] = np.concatenate([df[name].values for df in dfs])
+        frames[row_name] = pd.DataFrame(columns, index=pd.RangeIndex(sum(len(df) for df in dfs)))
+    return frames
+
+
 # class TPF(CSVFile):
 #     _skip = 3
 #     symbol = Field(0)
@@ -1,4 +1,5 @@
 
+import os
 import re
 import csv
 from datetime import datetime
@@ -9,36 +10,40 @@ import pandas as pd
 import lxml.html
 from lxml import etree
 
-from . import PortugueseRulesParser2
+from . import PortugueseRulesParser2, TypedColumns, open_input, is_path
 
 
 class AnbimaTPF:
-    def __init__(self, fname):
+    def __init__(self, fname, typed=False):
+        '''With `typed` each column is converted by the converter of its type,
+        inferred from the first rows, see `TypedColumns`.'''
         self.fname = fname
+        self.typed = typed
         self.encoding = 'latin1'
         self.instruments = []
         self.pp = PortugueseRulesParser2()
         self.parse()
 
     def parse(self):
-        with open(self.fname, 'r', encoding=self.encoding) as fp:
+        with open_input(self.fname, 'r', encoding=self.encoding) as fp:
             self._parse(fp)
 
     def _parse(self, fp):
         _drop_first_n = dropwhile(lambda x: x[0] < 3, enumerate(fp))
         _drop_empy = filter(lambda x: x[1].strip() != '', _drop_first_n)
-        for _, line in _drop_empy:
-            row = line.split('@')
+        rows = [line.split('@') for _, line in _drop_empy]
+        parse = _column_parsers(self.pp, rows, [1, 3, 4, 5, 6, 7, 8], self.typed)
+        for row in rows:
             tit = dict(
                 symbol=row[0],
-                refdate=self.pp.parse(row[1]),
+                refdate=parse[1](row[1]),
                 cod_selic=row[2],
-                issue_date=self.pp.parse(row[3]),
-                maturity_date=self.pp.parse(row[4]),
-                bid_yield=self.pp.parse(row[5]),
-                ask_yield=self.pp.parse(row[6]),
-                ref_yield=self.pp.parse(row[7]),
-                price=self.pp.parse(row[8])
+                issue_date=parse[3](row[3]),
+                maturity_date=parse[4](row[4]),
+                bid_yield=parse[5](row[5]),
+                ask_yield=parse[6](row[6]),
+                ref_yield=parse[7](row[7]),
+                price=parse[8](row[8])
             )
             self.instruments.append(tit)
 
@@ -49,15 +54,16 @@ class AnbimaTPF:
 
 
 class AnbimaDebentures:
-    def __init__(self, fname):
+    def __init__(self, fname, typed=False):
         self.fname = fname
+        self.typed = typed
         self.encoding = 'latin1'
         self.instruments = []
         self.pp = PortugueseRulesParser2()
         self.parse()
 
     def parse(self):
-        with open(self.fname, 'r', encoding=self.encoding) as fp:
+        with open_input(self.fname, 'r', encoding=self.encoding) as fp:
             self._parse(fp)
 
     def _parse(self, fp):
@@ -76,25 +82,28 @@ class AnbimaDebentures:
         # 12 Duration@
         # 13 % Reune@
         # 14 Referência NTN-B
-        m = re.search(r'\d{4}-\d\d-\d\d', self.fname)
+        # the reference date is only known from file names
+        fname = os.fspath(self.fname) if is_path(self.fname) else ''
+        m = re.search(r'\d{4}-\d\d-\d\d', fname)
         refdate = m.group() if m else None
         _drop_first_n = dropwhile(lambda x: x[0] < 3, enumerate(fp))
         _drop_empy = filter(lambda x: x[1].strip() != '', _drop_first_n)
-        for _, line in _drop_empy:
-            row = line.strip().split('@')
+        rows = [line.strip().split('@') for _, line in _drop_empy]
+        parse = _column_parsers(self.pp, rows, [2, 4, 5, 6, 10, 11, 12, 13, 14], self.typed)
+        for row in rows:
             tit = dict(
                 symbol=row[0],
                 name=row[1],
-                maturity_date=self.pp.parse(row[2]),
+                maturity_date=parse[2](row[2]),
                 underlying=row[3],
-                bid_yield=self.pp.parse(row[4]),
-                ask_yield=self.pp.parse(row[5]),
-                ref_yield=self.pp.parse(row[6]),
-                price=self.pp.parse(row[10]),
-                perc_price_par=self.pp.parse(row[11]),
-                duration=self.pp.parse(row[12]),
-                perc_reune=self.pp.parse(row[13]),
-                ref_ntnb=self.pp.parse(row[14]),
+                bid_yield=parse[4](row[4]),
+                ask_yield=parse[5](row[5]),
+                ref_yield=parse[6](row[6]),
+                price=parse[10](row[10]),
+                perc_price_par=parse[11](row[11]),
+                duration=parse[12](row[12]),
+                perc_reune=parse[13](row[13]),
+                ref_ntnb=parse[14](row[14]),
                 refdate=refdate, # from filename
             )
             self.instruments.append(tit)
@@ -105,6 +114,62 @@ class AnbimaDebentures:
         return self._data
 
 
+# the rows of the VNA tables of the ANBIMA page, all found in one search
+_VNA_IDS = ('listaNTN-B', 'listaNTN-C', 'listaLFT')
+_VNA_ROWS = etree.XPath(
+    "//div[@id='listaNTN-B' or @id='listaNTN-C' or @id='listaLFT']/*/table/tr")
+
+
+def extract_vna_tables(root):
+    '''Returns the rows (tr elements) of the listaNTN-B, listaNTN-C and
+    listaLFT tables of an ANBIMA VNA page by div id.'''
+    tables = dict((id, []) for id in _VNA_IDS)
+    for tr in _VNA_ROWS(root):
+        tables[tr.getparent().getparent().getparent().get('id')].append(tr)
+    return tables
+
+
+def _vna_cells(tr):
+    # only the cells, comments and other nodes are skipped
+    return tr.findall('td')
+
+
+def parse_vna_page(fname, pp, encoding='latin1'):
+    '''Returns the records of the listaNTN-B, listaNTN-C and listaLFT tables
+    of an ANBIMA VNA page, empty for missing tables, using the
+    PortugueseRulesParser2 `pp`.'''
+    with open_input(fname, 'r', encoding=encoding) as fp:
+        tree = etree.parse(fp, etree.HTMLParser())
+    tables = extract_vna_tables(tree)
+    return [_parse_vna_table(tables[id], pp) for id in _VNA_IDS]
+
+
+def _parse_vna_table(trs, pp):
+    if len(trs) == 0:
+        return {}
+    rows = [_vna_cells(tr) for tr in trs]
+    instrument_ref = get_all_node_text(trs[0])
+    date = get_all_node_text(rows[1][1])
+    index_ref = get_all_node_text(rows[2][1])
+    value = get_all_node_text(rows[3][1])
+    rate_value = get_all_node_text(rows[3][2])
+    try:
+        projection = get_all_node_text(rows[3][3]) == 'P'
+        rate_date = get_all_node_text(rows[3][4])
+    except IndexError:
+        projection = False
+        rate_date = ''
+    return {
+        'refdate': pp.parse(date),
+        'value': pp.parse(value),
+        'rate': pp.parse(rate_value),
+        'rate_start_date': pp.parse(rate_date),
+        'proj': projection,
+        'index_ref': index_ref,
+        'instrument_ref': instrument_ref
+    }
+
+
 class AnbimaVnaTPF:
     def __init__(self, fname):
         self.fname = fname
@@ -114,65 +179,57 @@ class AnbimaVnaTPF:
         self.parse()
 
     def parse(self):
-        with open(self.fname, 'r', encoding=self.encoding) as fp:
-            parser = etree.HTMLParser()
-            tree = etree.parse(fp, parser)
-            self._data.append(self._parse_vna_node(tree, 'listaNTN-B'))
-            self._data.append(self._parse_vna_node(tree, 'listaNTN-C'))
-            self._data.append(self._parse_vna_node(tree, 'listaLFT'))
-
-    def _parse_vna_node(self, tree, id):
-        trs = tree.xpath(f"//div[@id='{id}']/*/table/tr")
-        if len(trs) == 0:
-            return {}
-        instrument_ref = get_all_node_text(trs[0])
-        date = get_all_node_text(trs[1][1])
-        index_ref = get_all_node_text(trs[2][1])
-        value = get_all_node_text(trs[3][1])
-        rate_value = get_all_node_text(trs[3][2])
-        try:
-            projection = get_all_node_text(trs[3][3]) == 'P'
-            rate_date = get_all_node_text(trs[3][4])
-        except IndexError:
-            projection = False
-            rate_date = ''
-        return {
-            'refdate': self.pp.parse(date),
-            'value': self.pp.parse(value),
-            'rate': self.pp.parse(rate_value),
-            'rate_start_date': self.pp.parse(rate_date),
-            'proj': projection,
-            'index_ref': index_ref,
-            'instrument_ref': instrument_ref
-        }
+        self._data = parse_vna_page(self.fname, self.pp, self.encoding)
 
     @property
     def data(self):
         return [x for x in self._data if x]
 
 
+def parse_vna_pages(fnames, encoding='latin1'):
+    '''Parses many VNA pages, sharing the parsers, and returns their data
+    as a DataFrame with the page in the column `source`. Use `run_batch`
+    to parse them in many processes.'''
+    pp = PortugueseRulesParser2()
+    records = []
+    for fname in fnames:
+        records.extend(dict(x, source=fname)
+                       for x in parse_vna_page(fname, pp, encoding) if x)
+    return pd.DataFrame(records)
+
+
+def _column_parsers(pp, rows, columns, typed):
+    # the parser of each column, by default the rules of pp tried on every cell
+    if not typed:
+        return dict((ix, pp.parse) for ix in columns)
+    typed = TypedColumns(TypedColumns.PTBR, pp.parse)
+    return dict((ix, typed.column_converter(ix, [row[ix] for row in rows[:typed.sample_size]]))
+                for ix in columns)
+
+
 def get_all_node_text(node):
     return ''.join(x.strip() for x in node.itertext())
 
 
-def parse_titpub(text, buf):
+def parse_titpub(text, buf, typed=False):
     pp = PortugueseRulesParser2()
     text = StringIO(text.decode('ISO-8859-1'))
     writer = csv.writer(buf)
     _drop_first_2 = dropwhile(lambda x: x[0] < 2, enumerate(text))
     _drop_empy = filter(lambda x: x[1].strip() != '', _drop_first_2)
-    for c, line in _drop_empy:
-        row = line.split('@')
+    rows = [line.split('@') for c, line in _drop_empy]
+    parse = _column_parsers(pp, rows, [5, 6, 7, 8], typed)
+    for row in rows:
         tit = dict(
             titulo=row[0],
             data_referencia=row[1],
             codigo_selic=row[2],
             data_base=row[3],
             data_vencimento=row[4],
-            taxa_compra=pp.parse(row[5]),
-            taxa_venda=pp.parse(row[6]),
-            taxa_ind=pp.parse(row[7]),
-            pu=pp.parse(row[8])
+            taxa_compra=parse[5](row[5]),
+            taxa_venda=parse[6](row[6]),
+            taxa_ind=parse[7](row[7]),
+            pu=parse[8](row[8])
         )
         writer.writerow(tit.values())
     date_str = datetime.strptime(tit['data_referencia'], '%Y%m%d').strftime('%Y-%m-%d')
@@ -184,32 +241,20 @@ def parse_vnataxatitpub(text, buf):
     writer = csv.writer(buf)
     writer.writerow(['data_ref', 'taxa', 'valor', 'projecao', 'vigencia'])
 
-    root = lxml.html.fromstring(text.decode('ISO-8859-1'))
-    
-    sel = "div#listaNTN-B > center > table > tr:nth-child(2) > td:nth-child(2)"
-    date = root.cssselect(sel)[0].text_content()
-    sel = "div#listaNTN-B > center > table > tr:nth-child(4) > td:nth-child(3)"
-    value = root.cssselect(sel)[0].text_content()
-    sel = "div#listaNTN-B > center > table > tr:nth-child(4) > td:nth-child(4)"
-    projecao = root.cssselect(sel)[0].text_content()
-    sel = "div#listaNTN-B > center > table > tr:nth-child(4) > td:nth-child(5)"
-    vigencia = root.cssselect(sel)[0].text_content()
-    writer.writerow([pp.parse(date), 'IPCA', pp.parse(value), projecao, pp.parse(vigencia)])
-    
-    sel = "div#listaNTN-C > center > table > tr:nth-child(2) > td:nth-child(2)"
-    date = root.cssselect(sel)[0].text_content()
-    sel = "div#listaNTN-C > center > table > tr:nth-child(4) > td:nth-child(3)"
-    value = root.cssselect(sel)[0].text_content()
-    sel = "div#listaNTN-C > center > table > tr:nth-child(4) > td:nth-child(4)"
-    projecao = root.cssselect(sel)[0].text_content()
-    sel = "div#listaNTN-C > center > table > tr:nth-child(4) > td:nth-child(5)"
-    vigencia = root.cssselect(sel)[0].text_content()
-    writer.writerow([pp.parse(date), 'IGPM', pp.parse(value), projecao, pp.parse(vigencia)])
-    
-    sel = "div#listaLFT > center > table > tr:nth-child(2) > td:nth-child(2)"
-    date = root.cssselect(sel)[0].text_content()
-    sel = "div#listaLFT > center > table > tr:nth-child(4) > td:nth-child(3)"
-    value = root.cssselect(sel)[0].text_content()
+    tables = extract_vna_tables(lxml.html.fromstring(text.decode('ISO-8859-1')))
+
+    for id, index in [('listaNTN-B', 'IPCA'), ('listaNTN-C', 'IGPM')]:
+        trs = tables[id]
+        date = _vna_cells(trs[1])[1].text_content()
+        cells = _vna_cells(trs[3])
+        value = cells[2].text_content()
+        projecao = cells[3].text_content()
+        vigencia = cells[4].text_content()
+        writer.writerow([pp.parse(date), index, pp.parse(value), projecao, pp.parse(vigencia)])
+
+    trs = tables['listaLFT']
+    date = _vna_cells(trs[1])[1].text_content()
+    value = _vna_cells(trs[3])[2].text_content()
     writer.writerow([pp.parse(date), 'SELIC', pp.parse(value), None, None])
 
     return pp.parse(date)
@@ -220,25 +265,12 @@ def parse_vnatitpub(text, buf):
     writer = csv.writer(buf)
     writer.writerow(['data_ref', 'titulo', 'VNA'])
 
-    root = lxml.html.fromstring(text.decode('ISO-8859-1'))
-    
-    sel = "div#listaNTN-B > center > table > tr:nth-child(2) > td:nth-child(2)"
-    date = root.cssselect(sel)[0].text_content()
-    sel = "div#listaNTN-B > center > table > tr:nth-child(4) > td:nth-child(2)"
-    value = root.cssselect(sel)[0].text_content()
-    writer.writerow([pp.parse(date), 'NTNB', pp.parse(value)])
-    
-    sel = "div#listaNTN-C > center > table > tr:nth-child(2) > td:nth-child(2)"
-    date = root.cssselect(sel)[0].text_content()
-    sel = "div#listaNTN-C > center > table > tr:nth-child(4) > td:nth-child(2)"
-    value = root.cssselect(sel)[0].text_content()
-    writer.writerow([pp.parse(date), 'NTNC', pp.parse(value)])
-    
-    sel = "div#listaLFT > center > table > tr:nth-child(2) > td:nth-child(2)"
-    date = root.cssselect(sel)[0].text_content()
-    sel = "div#listaLFT > center > table > tr:nth-child(4) > td:nth-child(2)"
-    value = root.cssselect(sel)[0].text_content()
-    writer.writerow([pp.parse(date), 'LFT', pp.parse(value)])
+    tables = extract_vna_tables(lxml.html.fromstring(text.decode('ISO-8859-1')))
 
-    return pp.parse(date)
+    for id, titulo in [('listaNTN-B', 'NTNB'), ('listaNTN-C', 'NTNC'), ('listaLFT', 'LFT')]:
+        trs = tables[id]
+        date = _vna_cells(trs[1])[1].text_content()
+        value = _vna_cells(trs[3])[1].text_content()
+        writer.writerow([pp.parse(date), titulo, pp.parse(value)])
 
+    return pp.parse(date)
@@ -1,11 +1,20 @@
 
+import io
+import re
 import json
+import time
+import zipfile
 from itertools import groupby
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
 
+import numpy as np
 import pandas as pd
 from lxml import etree
 
 from . import PortugueseRulesParser2, read_fwf, FWFFile, FWFRow, Field, DateField, NumericField
+from . import clear_element, PathExtractor, records_to_frame, list_zip_members, read_zip_member
+from . import open_input
 
 class TaxaSwap:
     widths = [6, 3, 2, 8, 2, 5, 15, 5, 5, 1, 14, 1, 5]
@@ -26,11 +35,16 @@ class TaxaSwap:
     ]
 
     def __init__(self, fname):
-        with open(fname, 'r') as fp:
-            rawdata = fp.read()
-            self.__data = read_fwf(rawdata.split('\n'), self.widths, self.colnames, parse_fun=self._parse)
-        self.__findata = [self._build_findata(list(v)) for k, v in groupby(self.__data, key=lambda x: x['cod_taxa'])]
-    
+        with open_input(fname, 'r') as fp:
+            self.__data = read_fwf(fp, self.widths, self.colnames, parse_fun=self._parse)
+        # curves are grouped in order of first appearance, the file is not
+        # required to be sorted by cod_taxa
+        groups = {}
+        for obj in self.__data:
+            groups.setdefault(obj['cod_taxa'], []).append(obj)
+        self.__findata = [self._build_findata(lst) for lst in groups.values()]
+        self.__curves = None
+
     def _parse(self, obj):
         obj['data_geracao_arquivo'] = '{}-{}-{}'.format(obj['data_geracao_arquivo'][:4], obj['data_geracao_arquivo'][4:6], obj['data_geracao_arquivo'][6:])
         obj['num_dias_corridos'] = int(obj['num_dias_corridos'])
@@ -40,21 +54,25 @@ class TaxaSwap:
         return obj
 
     def _build_findata(self, lst):
-        taxa_teorica = [obj['taxa_teorica']*obj['sinal_taxa'] for obj in lst]
-        num_dias_corridos = [obj['num_dias_corridos'] for obj in lst]
-        num_dias_saques = [obj['num_dias_saques'] for obj in lst]
-        carat_vertice = [obj['carat_vertice'] for obj in lst]
-        keys = ('current_days', 'business_days', 'type', 'value')
-        terms = [dict(zip(keys, x)) for x in zip(num_dias_corridos, num_dias_saques, carat_vertice, taxa_teorica)]
-
         return {
             'refdate': lst[0]['data_geracao_arquivo'],
             'id': lst[0]['cod_taxa'],
             'name': lst[0]['cod_curvas'],
             'description': lst[0]['desc_taxa'],
-            'terms': terms
+            'current_days': np.array([obj['num_dias_corridos'] for obj in lst]),
+            'business_days': np.array([obj['num_dias_saques'] for obj in lst]),
+            'types': np.array([obj['carat_vertice'] for obj in lst]),
+            'rates': np.array([obj['taxa_teorica']*obj['sinal_taxa'] for obj in lst]),
         }
 
+    def curve(self, id, days='business_days', base=252):
+        '''Returns the SwapCurve of the curve `id` with terms in `days`
+        (business_days or current_days).'''
+        if self.__curves is None:
+            self.__curves = dict((curve['id'], curve) for curve in self.__findata)
+        curve = self.__curves[id]
+        return SwapCurve(curve[days], curve['rates'], base)
+
     @property
     def data(self):
         return self.__data
@@ -64,6 +82,51 @@ class TaxaSwap:
         return self.__findata
 
 
+class SwapCurve:
+    '''Interest rate curve with vectorized interpolation.
+
+    `terms` are the days of the vertices and `rates` the annual rates in
+    percent compounded over `base` days.
+
+    >>> curve = TaxaSwap('TS190910.txt').curve('PRE')
+    >>> curve.flat_forward([1, 21, 252, 2520])
+    '''
+    def __init__(self, terms, rates, base=252):
+        terms = np.asarray(terms, dtype=np.float64)
+        rates = np.asarray(rates, dtype=np.float64)
+        idx = np.argsort(terms, kind='stable')
+        self.terms = terms[idx]
+        self.rates = rates[idx]
+        self.base = base
+
+    def __call__(self, terms, method='flat_forward'):
+        return getattr(self, method)(terms)
+
+    def linear(self, terms):
+        '''Interpolates the rates linearly, rates are flat beyond the first
+        and the last vertices.'''
+        return np.interp(np.asarray(terms, dtype=np.float64), self.terms, self.rates)
+
+    def flat_forward(self, terms):
+        '''Interpolates the compounding factors exponentially, so that the
+        forward rates are constant between vertices. The rate of the first
+        vertex is used before it and the last forward rate after the last
+        vertex.'''
+        terms = np.asarray(terms, dtype=np.float64)
+        x = self.terms
+        # log of the compounding factors of the vertices
+        y = x / self.base * np.log1p(self.rates / 100)
+        if len(x) > 1:
+            fwd = (y[-1] - y[-2]) / (x[-1] - x[-2])
+        else:
+            fwd = y[-1] / x[-1]
+        logf = np.interp(terms, x, y)
+        logf = np.where(terms > x[-1], y[-1] + (terms - x[-1]) * fwd, logf)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rates = np.expm1(logf * self.base / terms) * 100
+        return np.where(terms <= x[0], self.rates[0], rates)
+
+
 class CDIIDI:
     def __init__(self, fname):
         self.fname = fname
@@ -71,7 +134,7 @@ class CDIIDI:
 
     def parse(self):
         text_parser = PortugueseRulesParser2()
-        with open(self.fname, 'r') as fp:
+        with open_input(self.fname, 'r') as fp:
             _data = json.loads(fp.read())
         cdi_data = {
             'refdate': text_parser.parse(_data['dataTaxa']),
@@ -176,14 +239,22 @@ class BVBG028:
         }
     }
 
-    def __init__(self, fname):
+    def __init__(self, fname, iterparse=False):
+        '''With `iterparse` the file is streamed and each instrument element
+        is freed once parsed, the memory used does not grow with the file.'''
         self.fname = fname
+        self.iterparse = iterparse
         self.instruments = []
         self.missing = set()
         self.parse()
 
     def parse(self):
-        with open(self.fname, 'rb') as fp:
+        if self.iterparse:
+            records = self._iterparse(self.fname, self.missing)
+            self.creation_date = next(records)
+            self.instruments.extend(records)
+            return
+        with open_input(self.fname) as fp:
             tree = etree.parse(fp)
         exchange = tree.getroot()[0][0]
         ns = {None: 'urn:bvmf.052.01.xsd'}
@@ -199,25 +270,60 @@ class BVBG028:
         for node in xs:
             self.parse_instrument_node(node)
 
+    @classmethod
+    def iter_records(cls, fname, missing=None):
+        '''Lazily yields the instruments of the file in constant memory, the
+        instrument types not handled are added to the `missing` set.'''
+        records = cls._iterparse(fname, set() if missing is None else missing)
+        next(records)
+        return records
+
+    @classmethod
+    def _iterparse(cls, fname, missing):
+        # yields the creation date and then the instruments
+        creation_date = None
+        tags = ('{urn:bvmf.052.01.xsd}BizGrpDtls', '{urn:bvmf.100.02.xsd}Instrm')
+        with open_input(fname) as fp:
+            for _, elm in etree.iterparse(fp, events=('end',), tag=tags):
+                if elm.tag == tags[0]:
+                    if creation_date is None:
+                        creation_date = elm.find('{urn:bvmf.052.01.xsd}CreDtAndTm').text[:10]
+                        yield creation_date
+                    continue
+                if creation_date is None:
+                    raise Exception('Invalid XML: tag BizGrpDtls not found')
+                data = cls._instrument_record(elm, creation_date, missing)
+                clear_element(elm)
+                if data is not None:
+                    yield data
+        if creation_date is None:
+            raise Exception('Invalid XML: tag BizGrpDtls not found')
+
     def parse_instrument_node(self, node):
-        data = {'creation_date': self.creation_date}
-        ns = {None: 'urn:bvmf.100.02.xsd'}
-        for attr in self.ATTRS['header']:
-            els = node.findall(self.ATTRS['header'][attr], ns)
-            if len(els):
-                data[attr] = els[0].text.strip()
-        elm = node.findall('InstrmInf', ns)[0]
+        data = self._instrument_record(node, self.creation_date, self.missing)
+        if data is not None:
+            self.instruments.append(data)
+
+    @classmethod
+    def _instrument_record(cls, node, creation_date, missing):
+        elm = node.find('{urn:bvmf.100.02.xsd}InstrmInf')
         # remove ns {urn:bvmf.100.02.xsd} = 21 chars
-        tag = elm.getchildren()[0].tag[21:]
-        if self.ATTRS.get(tag) is None:
-            self.missing.add(tag)
-            return
-        for attr in self.ATTRS[tag]:
-            els = node.findall(self.ATTRS[tag][attr], ns)
-            if len(els):
-                data[attr] = els[0].text.strip()
+        tag = elm[0].tag[21:]
+        if cls.ATTRS.get(tag) is None:
+            missing.add(tag)
+            return None
+        data = cls._extractor(tag).extract(node, {'creation_date': creation_date})
         data['instrument_type'] = tag
-        self.instruments.append(data)
+        return data
+
+    _extractors = {}
+
+    @classmethod
+    def _extractor(cls, tag):
+        if tag not in cls._extractors:
+            paths = dict(cls.ATTRS['header'], **cls.ATTRS[tag])
+            cls._extractors[tag] = PathExtractor(paths, 'urn:bvmf.100.02.xsd', strip=True)
+        return cls._extractors[tag]
 
     @property
     def data(self):
@@ -225,6 +331,78 @@ class BVBG028:
 
 
 class BVBG086:
+    ATTRS = {
+        'trade_date': 'TradDt/Dt',
+        'symbol': 'SctyId/TckrSymb',
+        'security_id': 'FinInstrmId/OthrId/Id',  # SecurityId
+        'security_proprietary': 'FinInstrmId/OthrId/Tp/Prtry',
+        'security_market': 'FinInstrmId/PlcOfListg/MktIdrCd',
+        'trade_quantity': 'TradDtls/TradQty',  # Negócios
+        'volume': 'FinInstrmAttrbts/NtlFinVol',
+        'open_interest': 'FinInstrmAttrbts/OpnIntrst',
+        'traded_contracts': 'FinInstrmAttrbts/FinInstrmQty',
+        'best_ask_price': 'FinInstrmAttrbts/BestAskPric',
+        'best_bid_price': 'FinInstrmAttrbts/BestBidPric',
+        'first_price': 'FinInstrmAttrbts/FrstPric',
+        'min_price': 'FinInstrmAttrbts/MinPric',
+        'max_price': 'FinInstrmAttrbts/MaxPric',
+        'average_price': 'FinInstrmAttrbts/TradAvrgPric',
+        'last_price': 'FinInstrmAttrbts/LastPric',
+        # Negócios na sessão regular
+        'regular_transactions_quantity': 'FinInstrmAttrbts/RglrTxsQty',
+        # Contratos na sessão regular
+        'regular_traded_contracts': 'FinInstrmAttrbts/RglrTraddCtrcts',
+        # Volume financeiro na sessão regular
+        'regular_volume': 'FinInstrmAttrbts/NtlRglrVol',
+        # Negócios na sessão não regular
+        'nonregular_transactions_quantity': 'FinInstrmAttrbts/NonRglrTxsQty',
+        # Contratos na sessão não regular
+        'nonregular_traded_contracts': 'FinInstrmAttrbts/NonRglrTraddCtrcts',
+        # Volume financeiro na sessão nãoregular
+        'nonregular_volume': 'FinInstrmAttrbts/NtlNonRglrVol',
+        'oscillation_percentage': 'FinInstrmAttrbts/OscnPctg',
+        'adjusted_quote': 'FinInstrmAttrbts/AdjstdQt',
+        'adjusted_tax': 'FinInstrmAttrbts/AdjstdQtTax',
+        'previous_adjusted_quote': 'FinInstrmAttrbts/PrvsAdjstdQt',
+        'previous_adjusted_tax': 'FinInstrmAttrbts/PrvsAdjstdQtTax',
+        'variation_points': 'FinInstrmAttrbts/VartnPts',
+        'adjusted_value_contract': 'FinInstrmAttrbts/AdjstdValCtrct',
+    }
+    EXTRACTOR = PathExtractor(ATTRS, 'urn:bvmf.217.01.xsd')
+    # quantities are Int64 because they are missing for some instruments
+    DTYPES = {
+        'creation_date': 'datetime64[ns]',
+        'trade_date': 'datetime64[ns]',
+        'symbol': 'object',
+        'security_id': 'object',
+        'security_proprietary': 'category',
+        'security_market': 'category',
+        'trade_quantity': 'Int64',
+        'volume': 'float64',
+        'open_interest': 'Int64',
+        'traded_contracts': 'Int64',
+        'best_ask_price': 'float64',
+        'best_bid_price': 'float64',
+        'first_price': 'float64',
+        'min_price': 'float64',
+        'max_price': 'float64',
+        'average_price': 'float64',
+        'last_price': 'float64',
+        'regular_transactions_quantity': 'Int64',
+        'regular_traded_contracts': 'Int64',
+        'regular_volume': 'float64',
+        'nonregular_transactions_quantity': 'Int64',
+        'nonregular_traded_contracts': 'Int64',
+        'nonregular_volume': 'float64',
+        'oscillation_percentage': 'float64',
+        'adjusted_quote': 'float64',
+        'adjusted_tax': 'float64',
+        'previous_adjusted_quote': 'float64',
+        'previous_adjusted_tax': 'float64',
+        'variation_points': 'float64',
+        'adjusted_value_contract': 'float64',
+    }
+
     def __init__(self, fname):
         self.fname = fname
         self.instruments = []
@@ -232,7 +410,7 @@ class BVBG086:
         self.parse()
 
     def parse(self):
-        with open(self.fname, 'rb') as fp:
+        with open_input(self.fname) as fp:
             tree = etree.parse(fp)
         exchange = tree.getroot()[0][0]
         ns = {None: 'urn:bvmf.052.01.xsd'}
@@ -249,51 +427,13 @@ class BVBG086:
             self.parse_price_report_node(node)
 
     def parse_price_report_node(self, node):
-        attrs = {
-            'trade_date': 'TradDt/Dt',
-            'symbol': 'SctyId/TckrSymb',
-            'security_id': 'FinInstrmId/OthrId/Id',  # SecurityId
-            'security_proprietary': 'FinInstrmId/OthrId/Tp/Prtry',
-            'security_market': 'FinInstrmId/PlcOfListg/MktIdrCd',
-            'trade_quantity': 'TradDtls/TradQty',  # Negócios
-            'volume': 'FinInstrmAttrbts/NtlFinVol',
-            'open_interest': 'FinInstrmAttrbts/OpnIntrst',
-            'traded_contracts': 'FinInstrmAttrbts/FinInstrmQty',
-            'best_ask_price': 'FinInstrmAttrbts/BestAskPric',
-            'best_bid_price': 'FinInstrmAttrbts/BestBidPric',
-            'first_price': 'FinInstrmAttrbts/FrstPric',
-            'min_price': 'FinInstrmAttrbts/MinPric',
-            'max_price': 'FinInstrmAttrbts/MaxPric',
-            'average_price': 'FinInstrmAttrbts/TradAvrgPric',
-            'last_price': 'FinInstrmAttrbts/LastPric',
-            # Negócios na sessão regular
-            'regular_transactions_quantity': 'FinInstrmAttrbts/RglrTxsQty',
-            # Contratos na sessão regular
-            'regular_traded_contracts': 'FinInstrmAttrbts/RglrTraddCtrcts',
-            # Volume financeiro na sessão regular
-            'regular_volume': 'FinInstrmAttrbts/NtlRglrVol',
-            # Negócios na sessão não regular
-            'nonregular_transactions_quantity': 'FinInstrmAttrbts/NonRglrTxsQty',
-            # Contratos na sessão não regular
-            'nonregular_traded_contracts': 'FinInstrmAttrbts/NonRglrTraddCtrcts',
-            # Volume financeiro na sessão nãoregular
-            'nonregular_volume': 'FinInstrmAttrbts/NtlNonRglrVol',
-            'oscillation_percentage': 'FinInstrmAttrbts/OscnPctg',
-            'adjusted_quote': 'FinInstrmAttrbts/AdjstdQt',
-            'adjusted_tax': 'FinInstrmAttrbts/AdjstdQtTax',
-            'previous_adjusted_quote': 'FinInstrmAttrbts/PrvsAdjstdQt',
-            'previous_adjusted_tax': 'FinInstrmAttrbts/PrvsAdjstdQtTax',
-            'variation_points': 'FinInstrmAttrbts/VartnPts',
-            'adjusted_value_contract': 'FinInstrmAttrbts/AdjstdValCtrct',
-        }
-        ns = {None: 'urn:bvmf.217.01.xsd'}
-        data = {'creation_date': self.creation_date}
-        for attr in attrs:
-            els = node.findall(attrs[attr], ns)
-            if len(els):
-                data[attr] = els[0].text
+        data = self.EXTRACTOR.extract(node, {'creation_date': self.creation_date})
         self.instruments.append(data)
 
+    def to_frame(self):
+        '''Returns the price reports as a DataFrame typed by DTYPES.'''
+        return records_to_frame(self.instruments, self.DTYPES)
+
     @property
     def data(self):
         return self.instruments
@@ -354,14 +494,38 @@ class COTAHIST_file(FWFFile):
     data = COTAHIST_histdata()
 
 
+def _data_selection(columns, where):
+    return {
+        'columns': None if columns is None else {'data': columns},
+        'where': None if where is None else {'data': where},
+    }
+
+
 class COTAHIST:
-    def __init__(self, fname):
+    def __init__(self, fname, as_frame=False, on_error='raise', workers=None, reader='text',
+                 columns=None, where=None):
+        '''`columns` is the list of fields of the data rows to parse and
+        `where` a dict of conditions on them, like {'cod_bdi': '02'}.'''
         self.fname = fname
+        self.as_frame = as_frame
+        self.on_error = on_error
+        self.workers = workers
+        self.reader = reader
+        self.columns = columns
+        self.where = where
         self._data = None
         self.parse()
 
     def parse(self):
-        self._data = COTAHIST_file(self.fname, encoding='latin1')
+        self._data = COTAHIST_file(self.fname, encoding='latin1', as_frame=self.as_frame,
+                                   on_error=self.on_error, workers=self.workers,
+                                   reader=self.reader, **_data_selection(self.columns, self.where))
+
+    @classmethod
+    def iter_records(cls, fname, on_error='raise', stats=None, reader='text', columns=None,
+                     where=None):
+        return COTAHIST_file.iter(fname, encoding='latin1', on_error=on_error, stats=stats,
+                                  reader=reader, **_data_selection(columns, where))
 
     @property
     def data(self):
@@ -375,12 +539,9 @@ class COTAHIST:
     def trailer(self):
         return self._data.trailer
 
-
-def smart_find(node, x, ns):
-    try:
-        return node.find(x, ns).text
-    except:
-        return None
+    @property
+    def stats(self):
+        return self._data.stats
 
 
 class BVBG087:
@@ -425,42 +586,154 @@ class BVBG087:
         }
     }
 
-    def __init__(self, fname):
+    EXTRACTORS = dict((tag, PathExtractor(attrs, 'urn:bvmf.218.01.xsd', keep_missing=True))
+                      for tag, attrs in ATTRS.items())
+
+    def __init__(self, fname, iterparse=False):
+        '''With `iterparse` the file is streamed and each element is freed
+        once parsed.'''
         self.fname = fname
+        self.iterparse = iterparse
         self.indexes = []
         self.parse()
 
     def parse(self):
-        with open(self.fname, 'rb') as fp:
-            tree = etree.parse(fp)
-
-        ns = {None: 'urn:bvmf.218.01.xsd'}
-        exchange = tree.getroot()[0][0]
-
-        td_xpath = etree.ETXPath('//{urn:bvmf.218.01.xsd}TradDt')
-        td = td_xpath(exchange)
-        if len(td) > 0:
-            trade_date = td[0].find('Dt', ns).text
-        else:
-            raise Exception('Invalid XML: tag TradDt not found')
-
-        for tag in self.ATTRS:
-            fields = self.ATTRS[tag]
-            _xpath = etree.ETXPath('//{urn:bvmf.218.01.xsd}%s' % tag)
-            for node in _xpath(exchange):
+        # all record types are dispatched in one pass over the document
+        tags = ['{urn:bvmf.218.01.xsd}%s' % tag for tag in ['TradDt'] + list(self.ATTRS)]
+        with open_input(self.fname) as fp:
+            if self.iterparse:
+                nodes = (elm for _, elm in etree.iterparse(fp, events=('end',), tag=tags))
+                self.indexes = self._parse_nodes(nodes)
+            else:
+                tree = etree.parse(fp)
+                exchange = tree.getroot()[0][0]
+                self.indexes = self._parse_nodes(exchange.iter(*tags))
+
+    def _parse_nodes(self, nodes):
+        trade_date = None
+        buckets = dict((tag, []) for tag in self.ATTRS)
+        for node in nodes:
+            tag = etree.QName(node).localname
+            if tag == 'TradDt':
+                if trade_date is None:
+                    trade_date = node.find('{urn:bvmf.218.01.xsd}Dt').text
+            else:
                 data = {
-                    'trade_date': trade_date,
+                    'trade_date': None,
                     'index_type': tag
                 }
-                for k in fields:
-                    data[k] = smart_find(node, fields[k], ns)
-                self.indexes.append(data)
+                buckets[tag].append(self.EXTRACTORS[tag].extract(node, data))
+            if self.iterparse:
+                clear_element(node)
+        if trade_date is None:
+            raise Exception('Invalid XML: tag TradDt not found')
+        # the records are grouped by type as in ATTRS
+        indexes = []
+        for tag in self.ATTRS:
+            for data in buckets[tag]:
+                data['trade_date'] = trade_date
+            indexes.extend(buckets[tag])
+        return indexes
 
     @property
     def data(self):
         return self.indexes
 
 
+ArchiveMember = namedtuple('ArchiveMember', 'name parser seconds error')
+
+
+class BVBGArchive:
+    '''Parses all XML documents of a B3 zip archive, like the PR, IN and IR
+    files, inner zip files included.
+
+    The parser of each member is chosen by the namespace of its document
+    and the members are parsed in a pool of `workers` processes. `members`
+    has the parser and the parsing time of each member in archive order.
+    Members that can not be parsed raise an error after all members are
+    parsed or, with `on_error='skip'`, are kept with their error.
+    '''
+    PARSERS = {
+        'urn:bvmf.100.02.xsd': BVBG028,
+        'urn:bvmf.217.01.xsd': BVBG086,
+        'urn:bvmf.218.01.xsd': BVBG087,
+    }
+
+    def __init__(self, fname, workers=None, on_error='raise'):
+        self.fname = fname
+        self.workers = workers
+        self.on_error = on_error
+        self.members = []
+        self.parse()
+
+    def parse(self):
+        # the members of an inner zip are parsed together, so that it is
+        # read once, the others one by one
+        tasks = []
+        for parent, members in groupby(list_zip_members(self.fname), key=lambda m: m[:-1]):
+            names = [m[-1] for m in members]
+            if parent:
+                tasks.append((parent, names))
+            else:
+                tasks.extend(((), [name]) for name in names)
+        args = ([self.fname] * len(tasks),) + tuple(zip(*tasks))
+        if self.workers and self.workers > 1:
+            with ProcessPoolExecutor(self.workers) as executor:
+                results = list(executor.map(_parse_archive_members, *args))
+        else:
+            results = list(map(_parse_archive_members, *args))
+        self.members = [m for members in results for m in members]
+        errors = [m for m in self.members if m.error is not None]
+        if errors and self.on_error == 'raise':
+            raise ValueError('Members not parsed: {}'.format(
+                ', '.join('{} ({})'.format('/'.join(m.name), m.error) for m in errors)))
+
+    @classmethod
+    def sniff_parser(cls, content, size=1 << 16):
+        '''Returns the parser class of the first namespace in the head of
+        the XML document that has one.'''
+        for ns in re.findall(rb'xmlns(?::\w+)?="([^"]+)"', content[:size]):
+            parser = cls.PARSERS.get(ns.decode('ascii'))
+            if parser is not None:
+                return parser
+
+    @property
+    def timings(self):
+        return [(m.name, m.seconds) for m in self.members]
+
+    @property
+    def data(self):
+        return [x for m in self.members if m.parser is not None for x in m.parser.data]
+
+
+def _parse_archive_members(fname, parent, names):
+    # parses the members `names` of the archive `parent` of fname, the
+    # errors of reading the archive are reported in its members
+    t = time.perf_counter()
+    try:
+        zf = zipfile.ZipFile(io.BytesIO(read_zip_member(fname, parent)) if parent else fname)
+    except Exception as e:
+        return [ArchiveMember(parent + (name,), None, time.perf_counter() - t, repr(e))
+                for name in names]
+    with zf:
+        return [_parse_archive_member(zf, fname, parent + (name,)) for name in names]
+
+
+def _parse_archive_member(zf, fname, member):
+    t = time.perf_counter()
+    try:
+        content = zf.read(member[-1])
+        parser_class = BVBGArchive.sniff_parser(content)
+        if parser_class is None:
+            return ArchiveMember(member, None, time.perf_counter() - t, 'unknown document')
+        parser = parser_class(content)
+    except Exception as e:
+        return ArchiveMember(member, None, time.perf_counter() - t, repr(e))
+    # the content is not sent back to the main process
+    parser.fname = '{}:{}'.format(fname, '/'.join(member))
+    return ArchiveMember(member, parser, time.perf_counter() - t, None)
+
+
 class StockIndexInfo:
     def __init__(self, fname):
         self.fname = fname
@@ -468,23 +741,16 @@ class StockIndexInfo:
         self.parse()
 
     def parse(self):
-        with open(self.fname) as fp:
+        with open_input(self.fname, 'r') as fp:
             self._data = json.loads(fp.read())
 
-        df = pd.DataFrame(self._data['results'])
-
-        def _(dfx):
-            indexes = dfx['indexes'].str.split(',').explode()
-            return pd.DataFrame({
-                'company': dfx['company'],
-                'spotlight': dfx['spotlight'],
-                'code': dfx['code'],
-                'indexes': indexes,
-            })
-
-        dfr = (df.groupby(['company', 'spotlight', 'code'])
-                 .apply(_)
-                 .reset_index(drop=True))
+        keys = ['company', 'spotlight', 'code']
+        df = pd.DataFrame(self._data['results'], columns=keys + ['indexes'])
+        # one row per company and index, ordered by company as groupby did
+        dfr = (df.dropna(subset=keys)
+                 .sort_values(keys, kind='stable')
+                 .assign(indexes=lambda x: x['indexes'].str.split(','))
+                 .explode('indexes', ignore_index=True))
 
         dfr['refdate'] = self._data['header']['update']
         dfr['duration_start_month'] = self._data['header']['startMonth']
@@ -498,7 +764,22 @@ class StockIndexInfo:
         })
 
         self._table = dfr
+        members = dfr.dropna(subset=['indexes'])
+        symbol_indexes = {}
+        for symbol, index in zip(members['symbol'].to_numpy(), members['indexes'].to_numpy()):
+            symbol_indexes.setdefault(symbol, set()).add(index)
+        self._symbol_indexes = dict((k, frozenset(v)) for k, v in symbol_indexes.items())
+        self._index_symbols = dict(
+            (index, symbols.unique()) for index, symbols in members.groupby('indexes')['symbol'])
+
+    def indexes(self, symbol):
+        '''Returns the set of indexes that have `symbol`.'''
+        return self._symbol_indexes.get(symbol, frozenset())
+
+    def symbols(self, index):
+        '''Returns the array of symbols in `index`.'''
+        return self._index_symbols.get(index, np.array([], dtype=object))
 
     @property
     def data(self):
-        return self._table
\ No newline at end of file
+        return self._table
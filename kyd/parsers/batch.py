@@ -0,0 +1,182 @@
+
+import os
+import sys
+import ast
+import glob
+import argparse
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from .b3 import BVBG028, BVBG086, BVBG087, TaxaSwap, CDIIDI, COTAHIST, StockIndexInfo
+from .anbima import AnbimaTPF, AnbimaDebentures, AnbimaVnaTPF
+
+
+PARSERS = {
+    'AnbimaTPF': AnbimaTPF,
+    'AnbimaDebentures': AnbimaDebentures,
+    'AnbimaVnaTPF': AnbimaVnaTPF,
+    'BVBG028': BVBG028,
+    'BVBG086': BVBG086,
+    'BVBG087': BVBG087,
+    'TaxaSwap': TaxaSwap,
+    'CDIIDI': CDIIDI,
+    'COTAHIST': COTAHIST,
+    'StockIndexInfo': StockIndexInfo,
+}
+
+FileResult = namedtuple('FileResult', ['fname', 'rows', 'error'])
+BatchResult = namedtuple('BatchResult', ['data', 'files'])
+
+
+def find_files(pattern=None, start=None, end=None, template=None):
+    '''Returns the files matching the glob `pattern` or, given a date range,
+    the existing files named by the strftime `template` for each day between
+    `start` and `end` (inclusive). Days without file are skipped.'''
+    if pattern is not None:
+        return sorted(glob.glob(pattern))
+    dates = pd.date_range(start, end, freq='D')
+    fnames = (date.strftime(template) for date in dates)
+    return [fname for fname in fnames if os.path.exists(fname)]
+
+
+def to_frame(parser):
+    '''Returns the data of a parser as a DataFrame.'''
+    if hasattr(parser, 'to_frame'):
+        return parser.to_frame()
+    data = parser.data
+    if isinstance(data, pd.DataFrame):
+        return data
+    if isinstance(data, dict):
+        return pd.DataFrame([data])
+    return pd.DataFrame(list(data))
+
+
+def output_names(fnames):
+    '''Returns the CSV file name of each file of `fnames`, its path relative
+    to the common directory of the files with the extension .csv, so files
+    with the same name in different directories (like per date directories)
+    keep their directories.'''
+    fnames = [os.path.abspath(fname) for fname in fnames]
+    if not fnames:
+        return []
+    root = os.path.commonpath([os.path.dirname(fname) for fname in fnames])
+    return [os.path.splitext(os.path.relpath(fname, root))[0] + '.csv' for fname in fnames]
+
+
+def _parse_file(cls, fname, kwargs, output):
+    # output is the CSV file of the data or None to return it
+    try:
+        df = to_frame(cls(fname, **kwargs))
+    except Exception as ex:
+        return FileResult(fname, 0, '{}: {}'.format(type(ex).__name__, ex)), None
+    if output is None:
+        return FileResult(fname, len(df), None), df
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    df.to_csv(output, index=False)
+    return FileResult(fname, len(df), None), None
+
+
+def run_batch(cls, fnames, workers=None, output=None, options=None, **kwargs):
+    '''Parses the files `fnames` with `cls(fname, **kwargs)` in a pool of
+    `workers` processes (all the cores by default). Parser arguments that
+    clash with the arguments of run_batch, like the `workers` of COTAHIST,
+    are given in the dict `options`.
+
+    The data of each file is concatenated into a DataFrame, with the file
+    name in the column `source`, or, given an `output` directory, written
+    to it as one CSV file per parsed file, named by `output_names`. Files
+    that can not be parsed don't stop the run, they are reported in
+    `files` with their error, as are files whose CSV file name is taken by
+    a previous file (like a.txt and a.dat in the same directory).
+
+    >>> res = run_batch(AnbimaTPF, find_files('data/ANBIMA_TPF_*.txt'), workers=4)
+    >>> [f for f in res.files if f.error]
+    '''
+    kwargs = dict(options or {}, **kwargs)
+    fnames = list(fnames)
+    names = [None] * len(fnames)
+    if output is not None:
+        os.makedirs(output, exist_ok=True)
+        names = output_names(fnames)
+    args, skipped, written = [], {}, {}
+    for ix, (fname, name) in enumerate(zip(fnames, names)):
+        if name in written:
+            msg = 'output {} already written for {}'.format(name, written[name])
+            skipped[ix] = FileResult(fname, 0, msg)
+            continue
+        if name is not None:
+            written[name] = fname
+        args.append((cls, fname, kwargs, name and os.path.join(output, name)))
+    if workers == 1 or len(args) < 2:
+        parsed = [_parse_file(*arg) for arg in args]
+    else:
+        with ProcessPoolExecutor(workers) as executor:
+            parsed = list(executor.map(_parse_file, *zip(*args)))
+    parsed = iter(parsed)
+    results = [(skipped[ix], None) if ix in skipped else next(parsed)
+               for ix in range(len(fnames))]
+    files = [res for res, _ in results]
+    data = None
+    if output is None:
+        frames = [df.assign(source=res.fname) for res, df in results if df is not None]
+        data = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    return BatchResult(data, files)
+
+
+def _parse_option(text):
+    # key=value, the value is a Python literal or else a string
+    key, sep, value = text.partition('=')
+    if not sep or not key:
+        raise ValueError(text)
+    try:
+        return key, ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return key, value
+
+
+def main(argv=None):
+    '''kyd command line: parses many files with one parser, `--option`
+    passes keyword arguments to the parser.
+
+    kyd AnbimaTPF 'data/ANBIMA_TPF_*.txt' -o output --option typed=True
+    kyd TaxaSwap --start 2021-01-01 --end 2021-12-31 --template data/TS%y%m%d.txt -f swap.csv
+    kyd COTAHIST 'COTAHIST_A*.TXT' --option "columns=['cod_negociacao', 'preco_ult']" \\
+        --option "where={'cod_bdi': '02'}" --option workers=1
+    '''
+    parser = argparse.ArgumentParser(prog='kyd', description='Parses files in parallel.')
+    parser.add_argument('parser', choices=sorted(PARSERS))
+    parser.add_argument('pattern', nargs='?', help='glob of the files to parse')
+    parser.add_argument('--start', help='first date of the files to parse')
+    parser.add_argument('--end', help='last date of the files to parse')
+    parser.add_argument('--template', help='strftime template of the file names')
+    parser.add_argument('-w', '--workers', type=int, default=None)
+    parser.add_argument('-o', '--output-dir', help='writes one CSV file per parsed file')
+    parser.add_argument('-f', '--output-file', help='writes all the data to one CSV file')
+    parser.add_argument('--option', action='append', default=[], metavar='KEY=VALUE',
+                        help='keyword argument of the parser, the value is a Python '
+                             'literal or a string, can be repeated')
+    args = parser.parse_args(argv)
+    if args.pattern is None and not (args.start and args.end and args.template):
+        parser.error('a glob pattern or --start, --end and --template are required')
+    try:
+        options = dict(_parse_option(text) for text in args.option)
+    except ValueError as ex:
+        parser.error('invalid option {}, use key=value'.format(ex))
+
+    fnames = find_files(args.pattern, args.start, args.end, args.template)
+    res = run_batch(PARSERS[args.parser], fnames, args.workers, args.output_dir,
+                    options=options)
+    if res.data is not None:
+        res.data.to_csv(args.output_file or sys.stdout, index=False)
+    failures = [f for f in res.files if f.error]
+    for f in failures:
+        print('{}: {}'.format(f.fname, f.error), file=sys.stderr)
+    print('{} files parsed, {} failed'.format(len(res.files) - len(failures), len(failures)),
+          file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
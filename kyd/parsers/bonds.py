@@ -0,0 +1,166 @@
+
+import numpy as np
+import pandas as pd
+import bizdays
+
+
+# annual coupon rates, paid semiannually
+COUPONS = {'NTN-F': 10.0, 'NTN-B': 6.0}
+# face values, NTN-B and LFT are priced as a percentage of their VNA
+FACE = {'LTN': 1000.0, 'NTN-F': 1000.0, 'NTN-B': 100.0, 'LFT': 100.0}
+
+
+class BusinessDays:
+    '''Counts business days of a bizdays calendar with numpy. The number of
+    business days before each day of the range of dates seen is kept in an
+    array, so a count is the difference of two lookups and the array is
+    reused by every call, it is only extended for dates out of the range.'''
+
+    def __init__(self, calendar='ANBIMA'):
+        cal = bizdays.Calendar.load(calendar)
+        holidays = np.array(cal.holidays, dtype='datetime64[D]')
+        self.calendar = np.busdaycalendar(holidays=holidays)
+        self._first = np.datetime64('2000-01-01', 'D')
+        self._before = np.zeros(1, dtype=np.int64)
+
+    def _extend(self, first, last):
+        # whole years around the dates, to extend the array once in a while
+        first = min(first, self._first).astype('datetime64[Y]').astype('datetime64[D]')
+        last = max(last, self._first + len(self._before))
+        last = (last.astype('datetime64[Y]') + 1).astype('datetime64[D]')
+        days = np.arange(first, last + 1)
+        is_bday = np.is_busday(days[:-1], busdaycal=self.calendar)
+        self._first = first
+        self._before = np.concatenate(([0], np.cumsum(is_bday)))
+
+    def count(self, start, end):
+        '''Returns the business days from `start` to `end`, a holiday `end`
+        is counted as its following business day, where payments happen.'''
+        start = np.asarray(start, dtype='datetime64[D]')
+        end = np.asarray(end, dtype='datetime64[D]')
+        if np.isnat(start).any() or np.isnat(end).any():
+            raise ValueError('Cannot count business days with NaT dates')
+        if start.size and end.size:
+            first, last = min(start.min(), end.min()), max(start.max(), end.max()) + 1
+            if first < self._first or last >= self._first + len(self._before):
+                self._extend(first, last)
+        # like busday_count, backwards counts are of (end, start]
+        backwards = start > end
+        before = self._before
+        return before[(end - self._first).astype(np.int64) + backwards] - \
+            before[(start - self._first).astype(np.int64) + backwards]
+
+
+_business_days = {}
+
+
+def business_days(calendar='ANBIMA'):
+    '''Returns the BusinessDays of `calendar`, built once per process.'''
+    if calendar not in _business_days:
+        _business_days[calendar] = BusinessDays(calendar)
+    return _business_days[calendar]
+
+
+def cash_flows(symbol, refdate, maturity, calendar='ANBIMA'):
+    '''Returns the business days to each payment and the payments of the
+    bonds as (bonds, payments) arrays, padded with zero payments. Coupons
+    are paid every 6 months back from the maturity. Bonds not in FACE have
+    NaN payments.'''
+    symbol = pd.Series(np.asarray(symbol, dtype=object))
+    refdate = np.asarray(refdate, dtype='datetime64[D]')
+    maturity = np.asarray(maturity, dtype='datetime64[D]')
+    face = symbol.map(FACE).to_numpy(np.float64)
+    rate = symbol.map(COUPONS).fillna(0).to_numpy(np.float64)
+    coupon = face * (np.sqrt(1 + rate / 100) - 1)
+
+    month = maturity.astype('datetime64[M]')
+    day = maturity - month.astype('datetime64[D]')
+    months = (month - refdate.astype('datetime64[M]')).astype(np.int64)
+    with_coupons = rate > 0
+    count = months[with_coupons].max() // 6 + 1 if with_coupons.any() else 0
+    k = np.arange(max(count, 1))
+    dates = (month[:, None] - 6 * k).astype('datetime64[D]') + day[:, None]
+    valid = (dates > refdate[:, None]) & ((k == 0) | with_coupons[:, None])
+    days = np.where(valid, business_days(calendar).count(refdate[:, None], dates), 0)
+    payments = np.where(valid, coupon[:, None], 0) + np.where(k == 0, face[:, None], 0)
+    payments[maturity <= refdate] = np.nan
+    return days, payments
+
+
+def _present_values(days, payments, rate):
+    t = days / 252
+    return payments * (1 + rate[:, None]) ** -t, t
+
+
+def _vna_scale(symbol, vna):
+    # NTN-B and LFT prices are their quotes times the VNA
+    if vna is None:
+        return 1.0
+    indexed = np.isin(np.asarray(symbol, dtype=object), ['NTN-B', 'LFT'])
+    return np.where(indexed, np.asarray(vna, dtype=np.float64) / 100, 1.0)
+
+
+def _price(days, payments, rate, scale):
+    pv, _ = _present_values(days, payments, np.asarray(rate, dtype=np.float64) / 100)
+    return pv.sum(axis=1) * scale
+
+
+def _duration(days, payments, rate):
+    pv, t = _present_values(days, payments, np.asarray(rate, dtype=np.float64) / 100)
+    return (t * pv).sum(axis=1) / pv.sum(axis=1)
+
+
+def price(symbol, refdate, maturity, rate, vna=None, calendar='ANBIMA'):
+    '''Returns the prices (PU) of the bonds given their yields in percent.
+    The prices of NTN-B and LFT are quotes, in percent of the VNA, unless
+    `vna` is given.'''
+    days, payments = cash_flows(symbol, refdate, maturity, calendar)
+    return _price(days, payments, rate, _vna_scale(symbol, vna))
+
+
+def bond_yield(symbol, refdate, maturity, pu, vna=None, calendar='ANBIMA',
+               tol=1e-12, maxiter=50):
+    '''Returns the yields in percent of the bonds given their prices (PU),
+    solved by Newton's method for all the bonds at once. Prices of NTN-B
+    and LFT are quotes unless `vna` is given. Yields that don't converge
+    are NaN.'''
+    days, payments = cash_flows(symbol, refdate, maturity, calendar)
+    target = np.asarray(pu, dtype=np.float64) / _vna_scale(symbol, vna)
+    rate = np.full(len(target), 0.1)
+    done = np.zeros(len(target), dtype=bool)
+    for _ in range(maxiter):
+        pv, t = _present_values(days, payments, rate)
+        f = pv.sum(axis=1) - target
+        df = -(t * pv).sum(axis=1) / (1 + rate)
+        step = np.where(done, 0, f / df)
+        rate = rate - step
+        done |= np.abs(step) < tol
+        if done.all():
+            break
+    return np.where(done, rate * 100, np.nan)
+
+
+def duration(symbol, refdate, maturity, rate, calendar='ANBIMA'):
+    '''Returns the Macaulay durations of the bonds in years of 252 business
+    days given their yields in percent.'''
+    days, payments = cash_flows(symbol, refdate, maturity, calendar)
+    return _duration(days, payments, rate)
+
+
+def analytics(data, rate='ref_yield', vna=None, calendar='ANBIMA'):
+    '''Returns the data of AnbimaTPF as a DataFrame with the business days
+    to maturity, the price computed from the `rate` column and the
+    duration of each bond. The cash flows are computed once for both.
+
+    >>> analytics(AnbimaTPF('ANBIMA_TPF_2021-05-10.txt').data)
+    '''
+    df = pd.DataFrame(data)
+    symbol = df['symbol'].to_numpy()
+    refdate = df['refdate'].to_numpy(dtype='datetime64[D]')
+    maturity = df['maturity_date'].to_numpy(dtype='datetime64[D]')
+    rates = df[rate].to_numpy(np.float64)
+    days, payments = cash_flows(symbol, refdate, maturity, calendar)
+    df['business_days'] = business_days(calendar).count(refdate, maturity)
+    df['model_price'] = _price(days, payments, rates, _vna_scale(symbol, vna))
+    df['duration'] = _duration(days, payments, rates)
+    return df
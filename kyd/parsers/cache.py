@@ -0,0 +1,296 @@
+
+import os
+import sys
+import shutil
+import pickle
+import hashlib
+import logging
+import tempfile
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from . import CacheInfo, is_path
+
+
+def file_digest(fname, block_size=1 << 20):
+    '''Returns the blake2b hex digest of the file content.'''
+    h = hashlib.blake2b(digest_size=20)
+    with open(fname, 'rb') as fp:
+        for block in iter(lambda: fp.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+_module_digests = {}
+
+
+def code_digest(cls):
+    '''Returns the digest of the source of the modules that define `cls` and
+    its bases, and of their packages, so that cache entries are invalidated
+    when the parser code changes.'''
+    modules = set()
+    for c in cls.__mro__:
+        parts = c.__module__.split('.')
+        modules.update('.'.join(parts[:k]) for k in range(1, len(parts) + 1))
+    h = hashlib.blake2b(digest_size=20)
+    for module in sorted(modules):
+        fname = getattr(sys.modules.get(module), '__file__', None)
+        if fname is None:
+            continue
+        if fname not in _module_digests:
+            _module_digests[fname] = file_digest(fname)
+        h.update(_module_digests[fname].encode())
+    return h.hexdigest()
+
+
+def _code_key(code):
+    # nested code objects (inner functions, comprehensions) are hashed by
+    # their content, frozensets are sorted as their order depends on the
+    # hash seed of the process
+    consts = []
+    for const in code.co_consts:
+        if isinstance(const, type(code)):
+            consts.append(_code_key(const))
+        elif isinstance(const, frozenset):
+            consts.append(repr(sorted(repr(c) for c in const)))
+        else:
+            consts.append(repr(const))
+    h = hashlib.blake2b(code.co_code, digest_size=20)
+    h.update(repr((code.co_names, code.co_varnames, consts)).encode())
+    return h.hexdigest()
+
+
+def _arg_key(value):
+    # a representation of the parser arguments stable across processes,
+    # functions are represented by their name and code instead of their
+    # address, arguments without a stable representation raise TypeError
+    if value is None or isinstance(value, (str, bytes, bool, int, float, date, np.generic)):
+        return repr(value)
+    if isinstance(value, dict):
+        items = sorted((_arg_key(k), _arg_key(v)) for k, v in value.items())
+        return '{%s}' % ', '.join('%s: %s' % item for item in items)
+    if isinstance(value, (list, tuple)):
+        return '%s(%s)' % (type(value).__name__, ', '.join(_arg_key(v) for v in value))
+    if isinstance(value, (set, frozenset)):
+        return 'set(%s)' % ', '.join(sorted(_arg_key(v) for v in value))
+    code = getattr(value, '__code__', None)
+    if code is not None:
+        try:
+            cells = [cell.cell_contents for cell in value.__closure__ or ()]
+        except ValueError:
+            raise TypeError('function {} has an empty closure cell'.format(value.__qualname__))
+        return '%s.%s:%s:%s:%s' % (value.__module__, value.__qualname__, _code_key(code),
+                                   _arg_key(value.__defaults__), _arg_key(cells))
+    raise TypeError('parser argument {!r} can not be used in a cache key'.format(value))
+
+
+class _FramePickler(pickle.Pickler):
+    # DataFrames are stored out of band, one .npy file per column, so that
+    # they can be memory mapped when loaded
+    def __init__(self, fp, path):
+        super().__init__(fp, protocol=pickle.HIGHEST_PROTOCOL)
+        self.path = path
+        self.count = 0
+
+    def persistent_id(self, obj):
+        if type(obj) is not pd.DataFrame or not isinstance(obj.index, pd.RangeIndex):
+            return None
+        columns = []
+        for name in obj.columns:
+            col = obj[name]
+            fname = '{}.npy'.format(self.count)
+            if isinstance(col.dtype, pd.CategoricalDtype):
+                np.save(os.path.join(self.path, fname), col.cat.codes.to_numpy())
+                columns.append((name, fname, col.cat.categories))
+            elif isinstance(col.dtype, np.dtype) and col.dtype.kind in 'biufcmM':
+                np.save(os.path.join(self.path, fname), col.to_numpy())
+                columns.append((name, fname, None))
+            else:
+                # object and extension columns (Int64, tz-aware datetimes)
+                # can not be memory mapped
+                columns.append((name, None, col))
+            self.count += 1
+        return ('frame', len(obj), columns)
+
+
+class _FrameUnpickler(pickle.Unpickler):
+    def __init__(self, fp, path):
+        super().__init__(fp)
+        self.path = path
+
+    def persistent_load(self, pid):
+        _, nrows, columns = pid
+        data = {}
+        for name, fname, extra in columns:
+            if fname is None:
+                data[name] = extra
+                continue
+            values = np.load(os.path.join(self.path, fname), mmap_mode='r')
+            if extra is None:
+                data[name] = values
+            else:
+                data[name] = pd.Categorical.from_codes(values, categories=extra)
+        return pd.DataFrame(data, index=pd.RangeIndex(nrows), copy=False)
+
+
+class ParseCache:
+    '''On disk cache of parsed files.
+
+    Entries are keyed by the parser class, its `cache_version` attribute,
+    the hash of the source of its modules, the parser arguments and the
+    hash of the file content, so a file is parsed again only if it or the
+    parser changes. Functions given as arguments, like `where` conditions,
+    are keyed by their code. The parser object is pickled with its
+    DataFrames stored as columns of .npy files, that are memory mapped on
+    a hit. Objects that can not be pickled, like parsers that keep a
+    lambda, are returned without being stored.
+
+    When the entries use more than `max_bytes` the least recently used are
+    evicted.
+
+    >>> cache = ParseCache('.kyd_cache')
+    >>> x = cache.parse(COTAHIST, 'COTAHIST_A2020.TXT', as_frame=True)
+    '''
+
+    def __init__(self, path, max_bytes=1 << 30):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(path, exist_ok=True)
+
+    def key(self, cls, fname, **kwargs):
+        h = hashlib.blake2b(digest_size=20)
+        h.update('{}.{}'.format(cls.__module__, cls.__qualname__).encode())
+        h.update(repr(getattr(cls, 'cache_version', 0)).encode())
+        h.update(code_digest(cls).encode())
+        h.update(_arg_key(kwargs).encode())
+        h.update(self.digest(fname).encode())
+        return h.hexdigest()
+
+    def digest(self, fname):
+        '''Returns the digest of the file content, it is hashed again only if
+        the size or the modification time of the file changes. Contents
+        given as bytes or seekable file objects are always hashed, file
+        objects are rewound to where they were.'''
+        if isinstance(fname, (bytes, bytearray, memoryview)):
+            return hashlib.blake2b(fname, digest_size=20).hexdigest()
+        if not is_path(fname):
+            return self._stream_digest(fname)
+        st = os.stat(fname)
+        stamp = '{} {} {}'.format(st.st_ino, st.st_size, st.st_mtime_ns)
+        path = os.path.join(self.path, '.digests')
+        os.makedirs(path, exist_ok=True)
+        name = hashlib.blake2b(os.path.abspath(fname).encode(), digest_size=20).hexdigest()
+        try:
+            with open(os.path.join(path, name)) as fp:
+                saved_stamp, digest = fp.read().rsplit(' ', 1)
+            if saved_stamp == stamp:
+                return digest
+        except (FileNotFoundError, ValueError):
+            pass
+        digest = file_digest(fname)
+        with open(os.path.join(path, name), 'w') as fp:
+            fp.write('{} {}'.format(stamp, digest))
+        return digest
+
+    @staticmethod
+    def _stream_digest(fp, block_size=1 << 20):
+        if not (hasattr(fp, 'read') and hasattr(fp, 'seekable') and fp.seekable()):
+            raise TypeError('ParseCache needs a file name, bytes or a seekable '
+                            'file object, not {}'.format(type(fp).__name__))
+        h = hashlib.blake2b(digest_size=20)
+        pos = fp.tell()
+        try:
+            for block in iter(lambda: fp.read(block_size), fp.read(0)):
+                h.update(block.encode() if isinstance(block, str) else block)
+        finally:
+            fp.seek(pos)
+        return h.hexdigest()
+
+    def parse(self, cls, fname, **kwargs):
+        '''Returns `cls(fname, **kwargs)` from the cache or parses the file
+        and stores it.'''
+        try:
+            _arg_key(kwargs)
+        except TypeError as ex:
+            logging.warning('not caching %s: %s', cls.__name__, ex)
+            self.misses += 1
+            return cls(fname, **kwargs)
+        key = self.key(cls, fname, **kwargs)
+        entry = os.path.join(self.path, key)
+        obj = self._load(entry)
+        if obj is not None:
+            self.hits += 1
+            # marks the entry as recently used
+            os.utime(entry)
+            return obj
+        self.misses += 1
+        obj = cls(fname, **kwargs)
+        self._store(entry, obj)
+        self.evict()
+        return obj
+
+    def _load(self, entry):
+        try:
+            fp = open(os.path.join(entry, 'obj.pkl'), 'rb')
+        except FileNotFoundError:
+            return None
+        try:
+            with fp:
+                return _FrameUnpickler(fp, entry).load()
+        except Exception:
+            # a corrupt entry is a miss and is parsed again
+            shutil.rmtree(entry, ignore_errors=True)
+            return None
+
+    def _store(self, entry, obj):
+        tmp = tempfile.mkdtemp(dir=self.path, prefix='.tmp-')
+        try:
+            with open(os.path.join(tmp, 'obj.pkl'), 'wb') as fp:
+                _FramePickler(fp, tmp).dump(obj)
+            os.rename(tmp, entry)
+        except (pickle.PicklingError, TypeError, AttributeError) as ex:
+            # the object is returned, only not cached
+            shutil.rmtree(tmp, ignore_errors=True)
+            logging.warning('not caching %s: %s', type(obj).__name__, ex)
+        except OSError:
+            # another process stored the same entry
+            shutil.rmtree(tmp, ignore_errors=True)
+            if not os.path.isdir(entry):
+                raise
+        except Exception:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.path):
+            entry = os.path.join(self.path, name)
+            if name.startswith('.') or not os.path.isdir(entry):
+                continue
+            size = sum(f.stat().st_size for f in os.scandir(entry))
+            entries.append((os.stat(entry).st_mtime, size, entry))
+        return sorted(entries)
+
+    def evict(self):
+        '''Removes the least recently used entries above the size cap.'''
+        entries = self._entries()
+        total = sum(e[1] for e in entries)
+        for _, size, entry in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+            self.evictions += 1
+
+    def clear(self):
+        for _, _, entry in self._entries():
+            shutil.rmtree(entry, ignore_errors=True)
+
+    def info(self):
+        return CacheInfo(self.hits, self.misses, self.max_bytes,
+                         sum(e[1] for e in self._entries()))
@@ -1,5 +1,11 @@
 
-from . import GenericParser, float_or_none
+import re
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from . import GenericParser, float_or_none, open_input, COLUMN_CONVERTERS
 
 def handle_row(row, names, parser=lambda x: x):
     fields = [parser(val.strip()) for val in row.split(';')]
@@ -10,18 +16,198 @@ def handle_row(row, names, parser=lambda x: x):
     return (cnpj_fundo_str_num, row)
 
 
+_INFORMES_DIARIOS_NAMES = 'CNPJ_FUNDO;DT_COMPTC;VL_TOTAL;VL_QUOTA;VL_PATRIM_LIQ;CAPTC_DIA;RESG_DIA;NR_COTST'.lower().split(';')
+_INFO_CADASTRAL_NAMES = 'CNPJ_FUNDO;DENOM_SOCIAL;DT_REG;DT_CONST;DT_CANCEL;SIT;DT_INI_SIT;DT_INI_ATIV;DT_INI_EXERC;DT_FIM_EXERC;CLASSE;DT_INI_CLASSE;RENTAB_FUNDO;CONDOM;FUNDO_COTAS;FUNDO_EXCLUSIVO;TRIB_LPRAZO;INVEST_QUALIF;TAXA_PERFM;INF_TAXA_PERFM;TAXA_ADM;INF_TAXA_ADM;VL_PATRIM_LIQ;DT_PATRIM_LIQ;DIRETOR;CNPJ_ADMIN;ADMIN;PF_PJ_GESTOR;CPF_CNPJ_GESTOR;GESTOR;CNPJ_AUDITOR;AUDITOR;CNPJ_CUSTODIANTE;CUSTODIANTE;CNPJ_CONTROLADOR;CONTROLADOR'.lower().split(';')
+_generic_parser = GenericParser()
+
+
 def handle_informes_diarios(row):
-    _names = 'CNPJ_FUNDO;DT_COMPTC;VL_TOTAL;VL_QUOTA;VL_PATRIM_LIQ;CAPTC_DIA;RESG_DIA;NR_COTST'
-    names = _names.lower().split(';')
-    parser = GenericParser()
-    return handle_row(row, names, parser.parse)
+    return handle_row(row, _INFORMES_DIARIOS_NAMES, _generic_parser.parse)
 
 
 def handle_info_cadastral(row):
-    _names = 'CNPJ_FUNDO;DENOM_SOCIAL;DT_REG;DT_CONST;DT_CANCEL;SIT;DT_INI_SIT;DT_INI_ATIV;DT_INI_EXERC;DT_FIM_EXERC;CLASSE;DT_INI_CLASSE;RENTAB_FUNDO;CONDOM;FUNDO_COTAS;FUNDO_EXCLUSIVO;TRIB_LPRAZO;INVEST_QUALIF;TAXA_PERFM;INF_TAXA_PERFM;TAXA_ADM;INF_TAXA_ADM;VL_PATRIM_LIQ;DT_PATRIM_LIQ;DIRETOR;CNPJ_ADMIN;ADMIN;PF_PJ_GESTOR;CPF_CNPJ_GESTOR;GESTOR;CNPJ_AUDITOR;AUDITOR;CNPJ_CUSTODIANTE;CUSTODIANTE;CNPJ_CONTROLADOR;CONTROLADOR'
-    names = _names.lower().split(';')
-    vals = handle_row(row, names)
+    vals = handle_row(row, _INFO_CADASTRAL_NAMES)
     vals[1]['taxa_perfm'] = float_or_none(vals[1]['taxa_perfm'])
     vals[1]['taxa_adm'] = float_or_none(vals[1]['taxa_adm'])
     vals[1]['vl_patrim_liq'] = float_or_none(vals[1]['vl_patrim_liq'])
     return vals
+
+
+INFORMES_DIARIOS_DTYPES = {
+    'cnpj_fundo': 'cnpj',
+    'dt_comptc': 'datetime64[ns]',
+    'vl_total': 'float64',
+    'vl_quota': 'float64',
+    'vl_patrim_liq': 'float64',
+    'captc_dia': 'float64',
+    'resg_dia': 'float64',
+    'nr_cotst': 'Int64',
+}
+
+INFO_CADASTRAL_DTYPES = {
+    'cnpj_fundo': 'cnpj',
+    'dt_reg': 'datetime64[ns]',
+    'dt_const': 'datetime64[ns]',
+    'dt_cancel': 'datetime64[ns]',
+    'dt_ini_sit': 'datetime64[ns]',
+    'dt_ini_ativ': 'datetime64[ns]',
+    'dt_ini_exerc': 'datetime64[ns]',
+    'dt_fim_exerc': 'datetime64[ns]',
+    'dt_ini_classe': 'datetime64[ns]',
+    'taxa_perfm': 'float64',
+    'taxa_adm': 'float64',
+    'vl_patrim_liq': 'float64',
+    'dt_patrim_liq': 'datetime64[ns]',
+}
+
+# positions of the digits of a CNPJ formatted as 00.000.000/0000-00
+_CNPJ_DIGITS = [0, 1, 3, 4, 5, 7, 8, 9, 11, 12, 13, 14, 16, 17]
+_CNPJ_SEPARATORS = {2: '.', 6: '.', 10: '/', 15: '-'}
+# key of missing CNPJs or CNPJs without digits
+MISSING_CNPJ = -1
+
+
+def cnpj_key(values):
+    '''Converts CNPJs, formatted or not, to int64 keys like 17024000153 for
+    00.017.024/0001-53. Missing values and values without digits are
+    MISSING_CNPJ.'''
+    values = pd.Series(values, dtype=object)
+    if len(values) == 0:
+        return np.zeros(0, dtype=np.int64)
+    chars = values.to_numpy(dtype='U18').view(np.uint32).reshape(len(values), -1)
+    if chars.shape[1] == 18:
+        valid = np.ones(len(values), dtype=bool)
+        for ix, sep in _CNPJ_SEPARATORS.items():
+            valid &= chars[:, ix] == ord(sep)
+        digits = chars[:, _CNPJ_DIGITS].astype(np.int64) - 48
+        valid &= ((digits >= 0) & (digits <= 9)).all(axis=1)
+        keys = digits @ 10 ** np.arange(13, -1, -1, dtype=np.int64)
+    else:
+        valid = np.zeros(len(values), dtype=bool)
+        keys = np.zeros(len(values), dtype=np.int64)
+    # other formats are cleaned one by one
+    for ix in np.flatnonzero(~valid):
+        value = values.iat[ix]
+        digits = re.sub(r'\D', '', value) if isinstance(value, str) else ''
+        keys[ix] = int(digits) if digits else MISSING_CNPJ
+    return keys
+
+
+def _load_csv(fname, dtypes, chunksize, encoding):
+    # numeric columns are parsed by read_csv, the others converted by chunk
+    native = dict((name.upper(), dtype) for name, dtype in dtypes.items()
+                  if dtype in ('float64', 'Int64'))
+    with open_input(fname) as fp:
+        reader = pd.read_csv(fp, sep=';', encoding=encoding, dtype=native,
+                             chunksize=chunksize)
+        for df in reader:
+            df.columns = [name.lower() for name in df.columns]
+            for name, dtype in dtypes.items():
+                if name not in df or dtype in ('float64', 'Int64'):
+                    continue
+                if dtype == 'cnpj':
+                    df[name] = cnpj_key(df[name])
+                else:
+                    df[name] = COLUMN_CONVERTERS[dtype](df[name])
+            yield df
+
+
+def load_informes_diarios(fname, chunksize=100000, encoding='latin1'):
+    '''Yields the daily reports of a CVM inf_diario_fi CSV file as DataFrames
+    of up to `chunksize` rows typed by INFORMES_DIARIOS_DTYPES, cnpj_fundo
+    is an int64 key.'''
+    return _load_csv(fname, INFORMES_DIARIOS_DTYPES, chunksize, encoding)
+
+
+def load_info_cadastral(fname, chunksize=100000, encoding='latin1'):
+    '''Yields the registry of a CVM cad_fi CSV file as DataFrames of up to
+    `chunksize` rows typed by INFO_CADASTRAL_DTYPES, cnpj_fundo is an int64
+    key.'''
+    return _load_csv(fname, INFO_CADASTRAL_DTYPES, chunksize, encoding)
+
+
+class InformesDiariosStore:
+    '''SQLite store of the CVM daily reports keyed by (cnpj_fundo, dt_comptc).
+
+    The table is clustered by fund and date, so the series of a fund is read
+    with a range scan, and re-published months are upserted touching only
+    the rows whose values changed.
+
+    >>> store = InformesDiariosStore('informes.db')
+    >>> store.ingest('inf_diario_fi_202104.csv')
+    >>> store.series('00.017.024/0001-53', start='2021-01-01')
+    '''
+    COLUMNS = ('vl_quota', 'vl_patrim_liq', 'captc_dia', 'resg_dia', 'nr_cotst')
+
+    def __init__(self, fname):
+        self.fname = fname
+        self.conn = sqlite3.connect(fname)
+        exists = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'informes_diarios'"
+        ).fetchone()
+        if not exists:
+            self._create()
+        cols = ', '.join(self.COLUMNS)
+        excluded = ', '.join('excluded.' + name for name in self.COLUMNS)
+        self._upsert_sql = '''INSERT INTO informes_diarios VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (cnpj_fundo, dt_comptc) DO UPDATE SET ({cols}) = ({excluded})
+            WHERE ({cols}) IS NOT ({excluded})'''.format(cols=cols, excluded=excluded)
+
+    def _create(self):
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS informes_diarios (
+            cnpj_fundo INTEGER NOT NULL,
+            dt_comptc INTEGER NOT NULL,
+            vl_quota REAL,
+            vl_patrim_liq REAL,
+            captc_dia REAL,
+            resg_dia REAL,
+            nr_cotst INTEGER,
+            PRIMARY KEY (cnpj_fundo, dt_comptc)
+        ) WITHOUT ROWID''')
+
+    def close(self):
+        self.conn.close()
+
+    def upsert(self, df):
+        '''Inserts or updates the rows of a DataFrame returned by
+        `load_informes_diarios` and returns the number of rows written,
+        unchanged rows are not counted.'''
+        df = df.sort_values(['cnpj_fundo', 'dt_comptc'])
+        # dates are stored as days since epoch, NaN is stored as NULL
+        days = df['dt_comptc'].to_numpy().astype('datetime64[D]').astype(np.int64)
+        columns = [df['cnpj_fundo'].to_numpy(np.int64).tolist(), days.tolist()]
+        columns += [df[name].to_numpy(np.float64, na_value=np.nan).tolist()
+                    for name in self.COLUMNS]
+        before = self.conn.total_changes
+        with self.conn:
+            self.conn.executemany(self._upsert_sql, zip(*columns))
+        return self.conn.total_changes - before
+
+    def ingest(self, fname, chunksize=100000, encoding='latin1'):
+        '''Upserts a CVM inf_diario_fi CSV file and returns the number of
+        rows written.'''
+        return sum(self.upsert(df)
+                   for df in load_informes_diarios(fname, chunksize, encoding))
+
+    def series(self, cnpj, start=None, end=None, columns=COLUMNS):
+        '''Returns the daily reports of a fund between `start` and `end`
+        (inclusive) as a DataFrame indexed by dt_comptc.'''
+        if isinstance(cnpj, str):
+            cnpj = cnpj_key([cnpj])[0]
+        start = -(1 << 62) if start is None else _epoch_days(start)
+        end = 1 << 62 if end is None else _epoch_days(end)
+        sql = '''SELECT dt_comptc, {} FROM informes_diarios
+            WHERE cnpj_fundo = ? AND dt_comptc BETWEEN ? AND ?
+            ORDER BY dt_comptc'''.format(', '.join(columns))
+        rows = self.conn.execute(sql, (int(cnpj), start, end)).fetchall()
+        df = pd.DataFrame.from_records(rows, columns=['dt_comptc'] + list(columns))
+        df['dt_comptc'] = df['dt_comptc'].to_numpy(np.int64).astype('datetime64[D]').astype('datetime64[ns]')
+        for name in columns:
+            df[name] = df[name].astype('Int64' if name == 'nr_cotst' else 'float64')
+        return df.set_index('dt_comptc')
+
+
+def _epoch_days(date):
+    return int(np.datetime64(pd.Timestamp(date), 'D').astype(np.int64))
@@ -8,6 +8,9 @@ setuptools.setup(
     name='kyd',
     version='0.0.1',
     packages=['kyd.parsers'],
+    entry_points={
+        'console_scripts': ['kyd=kyd.parsers.batch:main'],
+    },
     author='Wilson Freitas',
     author_email='wilson.freitas@gmail.com',
     description='kyd - know your data.',
@@ -0,0 +1,241 @@
+'''Synthetic files in the formats read by the kyd parsers, shared by the
+benchmarks and the tests. `gen_<format>(fname, n)` writes a file of `n`
+records (the VNA and CDIIDI files have a fixed size), the same file for
+the same `n`.'''
+import json
+import random
+from datetime import date, timedelta
+
+
+def _dates(n, start=date(2020, 1, 2)):
+    return [start + timedelta(days=i % 3650) for i in range(n)]
+
+
+def _symbols(rnd, n):
+    return ['{}{}{}'.format(''.join(rnd.choice('ABCDEFGHIJKLMNOPQRSTUVWXYZ') for _ in range(4)),
+                            rnd.choice('34'), '' if i % 3 else 'F') for i in range(n)]
+
+
+def gen_cotahist(fname, n):
+    rnd = random.Random(n)
+    with open(fname, 'w', encoding='latin1', newline='') as fp:
+        fp.write('00COTAHIST.2020BOVESPA 20201230' + ' ' * 214 + '\r\n')
+        for i, (dt, symbol) in enumerate(zip(_dates(n), _symbols(rnd, n))):
+            prices = ''.join('%013d' % rnd.randint(1, 10 ** 7) for _ in range(7))
+            fp.write(
+                '01' + dt.strftime('%Y%m%d') + rnd.choice(['02', '96', '12'])
+                + symbol.ljust(12) + '010' + 'EMPRESA S.A.'.ljust(12) + 'ON NM'.ljust(10)
+                + '   ' + 'R$'.ljust(4) + prices + '%05d' % rnd.randint(1, 99999)
+                + '%018d' % rnd.randint(0, 10 ** 12) + '%018d' % rnd.randint(0, 10 ** 15)
+                + '%013d' % 0 + '0' + '99991231' + '%07d' % 1 + '%013d' % 0
+                + 'BR' + symbol[:4] + 'ACNOR0' + '%03d' % (i % 1000) + '\r\n')
+        fp.write('99COTAHIST.2020BOVESPA 20201230' + '%011d' % (n + 2) + ' ' * 203 + '\r\n')
+
+
+def _xml_doc(fname, doc_ns, nodes, head=''):
+    with open(fname, 'w', encoding='utf8') as fp:
+        fp.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                 '<Document xmlns="urn:bvmf.052.01.xsd"><BizFileHdr><Xchg>'
+                 '<BizGrpDtls><CreDtAndTm>2021-05-10T08:00:00</CreDtAndTm></BizGrpDtls>'
+                 '<BizGrp>{}<Document xmlns="urn:bvmf.{}.xsd">'.format(head, doc_ns))
+        for node in nodes:
+            fp.write(node)
+        fp.write('</Document></BizGrp></Xchg></BizFileHdr></Document>\n')
+
+
+def _xml(tag, *children, text=None):
+    return '<{0}>{1}</{0}>'.format(tag, text if text is not None else ''.join(children))
+
+
+def gen_bvbg028(fname, n):
+    rnd = random.Random(n)
+
+    def instrument(i, symbol):
+        header = (
+            _xml('RptParams', _xml('RptDtAndTm', _xml('Dt', text='2021-05-10')))
+            + _xml('FinInstrmId', _xml('OthrId', _xml('Id', text=str(200000000 + i)),
+                                       _xml('Tp', _xml('Prtry', text='8')),
+                                       _xml('PlcOfListg', _xml('MktIdrCd', text='BVMF'))))
+            + _xml('FinInstrmAttrCmon', _xml('Asst', text=symbol[:4]),
+                   _xml('AsstDesc', text='EMPRESA'), _xml('Mkt', text='10'),
+                   _xml('Sgmt', text='1'), _xml('Desc', text='EMPRESA ON NM')))
+        if i % 2:
+            inf = _xml('EqtyInf', _xml('SctyCtgy', text='3'), _xml('ISIN', text='BR' + symbol),
+                       _xml('CrpnNm', text='EMPRESA S.A.'), _xml('TckrSymb', text=symbol),
+                       _xml('PmtTp', text='1'), _xml('AllcnRndLot', text='100'),
+                       _xml('PricFctr', text='1'), _xml('TradgStartDt', text='2000-01-01'),
+                       _xml('TradgEndDt', text='9999-12-31'), _xml('TradgCcy', text='BRL'),
+                       _xml('MktCptlstn', text=str(rnd.randint(10 ** 6, 10 ** 9))),
+                       _xml('LastPric', text='%.2f' % rnd.uniform(1, 100)),
+                       _xml('DaysToSttlm', text='2'))
+        else:
+            inf = _xml('OptnOnEqtsInf', _xml('SctyCtgy', text='4'),
+                       _xml('ISIN', text='BR' + symbol), _xml('TckrSymb', text=symbol),
+                       _xml('ExrcPric', text='%.2f' % rnd.uniform(1, 100)),
+                       _xml('OptnStyle', text='EURO'), _xml('XprtnDt', text='2021-06-21'),
+                       _xml('OptnTp', text='CALL'), _xml('TradgCcy', text='BRL'))
+        return _xml('Instrm', header, _xml('InstrmInf', inf))
+
+    _xml_doc(fname, '100.02', (instrument(i, s) for i, s in enumerate(_symbols(rnd, n))))
+
+
+def gen_bvbg086(fname, n):
+    rnd = random.Random(n)
+
+    def report(i, symbol):
+        prices = ''.join(_xml(tag, text='%.2f' % rnd.uniform(1, 100))
+                         for tag in ('BestAskPric', 'BestBidPric', 'FrstPric', 'MinPric',
+                                     'MaxPric', 'TradAvrgPric', 'LastPric'))
+        return _xml(
+            'PricRpt', _xml('TradDt', _xml('Dt', text='2021-05-10')),
+            _xml('SctyId', _xml('TckrSymb', text=symbol)),
+            _xml('FinInstrmId', _xml('OthrId', _xml('Id', text=str(100000000 + i)),
+                                     _xml('Tp', _xml('Prtry', text='8'))),
+                 _xml('PlcOfListg', _xml('MktIdrCd', text='BVMF'))),
+            _xml('TradDtls', _xml('TradQty', text=str(rnd.randint(1, 10000)))),
+            _xml('FinInstrmAttrbts', _xml('MktDataStrmId', text='E'),
+                 _xml('NtlFinVol', text='%.2f' % rnd.uniform(1e3, 1e9)),
+                 _xml('FinInstrmQty', text=str(rnd.randint(1, 10 ** 6))), prices,
+                 _xml('OscnPctg', text='%.2f' % rnd.uniform(-10, 10))))
+
+    _xml_doc(fname, '217.01', (report(i, s) for i, s in enumerate(_symbols(rnd, n))))
+
+
+def gen_bvbg087(fname, n):
+    rnd = random.Random(n)
+
+    def index(i, symbol):
+        security = (_xml('SctyId', _xml('TckrSymb', text=symbol))
+                    + _xml('FinInstrmId', _xml('OthrId', _xml('Id', text=str(i)),
+                                               _xml('Tp', _xml('Prtry', text='8'))),
+                           _xml('PlcOfListg', _xml('MktIdrCd', text='BVMF'))))
+        prices = ''.join(_xml(tag, text='%.2f' % rnd.uniform(1000, 100000))
+                         for tag in ('OpngPric', 'MinPric', 'MaxPric', 'TradAvrgPric',
+                                     'ClsgPric', 'IndxVal', 'OscnVal'))
+        if i % 3 == 0:
+            return _xml('IndxInf', _xml('SctyInf', security, prices),
+                        _xml('AsstDesc', text='INDICE'), _xml('SttlmVal', text='1.0'),
+                        _xml('RsngShrsNb', text='10'), _xml('FlngShrsNb', text='20'),
+                        _xml('StblShrsNb', text='3'))
+        if i % 3 == 1:
+            return _xml('IOPVInf', security, prices)
+        return _xml('BDRInf', security, _xml('RefPric', text='%.2f' % rnd.uniform(1, 100)))
+
+    nodes = (_xml('IndxRpt', _xml('TradDt', _xml('Dt', text='2021-05-10')), index(i, s))
+             for i, s in enumerate(_symbols(rnd, n)))
+    _xml_doc(fname, '218.01', nodes)
+
+
+def _br(x, dec=2):
+    return '{:,.{}f}'.format(x, dec).replace(',', '_').replace('.', ',').replace('_', '.')
+
+
+def gen_tpf(fname, n):
+    rnd = random.Random(n)
+    with open(fname, 'w', encoding='latin1') as fp:
+        fp.write('ANBIMA - Associação Brasileira das Entidades dos Mercados Financeiro e de Capitais\n\n')
+        fp.write('Titulo@Data Referencia@Codigo SELIC@Data Base/Emissao@Data Vencimento'
+                 '@Tx. Compra@Tx. Venda@Tx. Indicativas@PU\n')
+        for dt in _dates(n):
+            fp.write('@'.join([
+                rnd.choice(['LTN', 'NTN-F', 'NTN-B', 'LFT']), '20210510', '100000',
+                '20100101', dt.strftime('%Y%m%d'), _br(rnd.uniform(2, 15), 4),
+                _br(rnd.uniform(2, 15), 4), _br(rnd.uniform(2, 15), 4),
+                _br(rnd.uniform(500, 5000), 6)]) + '\n')
+
+
+def gen_debentures(fname, n):
+    rnd = random.Random(n)
+    with open(fname, 'w', encoding='latin1') as fp:
+        fp.write('ANBIMA\n\nCódigo@Nome@Repac./  Venc.@Índice/ Correção@Taxa de Compra'
+                 '@Taxa de Venda@Taxa Indicativa@Desvio Padrão@Min@Max@PU@% PU Par@Duration'
+                 '@% Reune@Referência NTN-B\n')
+        for i, dt in enumerate(_dates(n)):
+            fp.write('@'.join([
+                'DEBN%02d' % (i % 100), 'EMPRESA S.A.', dt.strftime('%d/%m/%Y'),
+                'IPCA + 5,0000%', _br(rnd.uniform(2, 9), 4), _br(rnd.uniform(2, 9), 4),
+                _br(rnd.uniform(2, 9), 4), _br(rnd.uniform(0, 1), 4), '--', '--',
+                _br(rnd.uniform(900, 1100), 6), _br(rnd.uniform(90, 110)),
+                _br(rnd.uniform(100, 3000), 0), '--', dt.strftime('%d/%m/%Y')]) + '\n')
+
+
+def gen_vna(fname, n=None):
+    def table(id, date, value):
+        return (
+            '<div id="{}"><center><table>'
+            '<tr><td>{}</td></tr>'
+            '<tr><td>Data de Referência</td><td>{}</td></tr>'
+            '<tr><td>Índice</td><td>IPCA</td></tr>'
+            '<tr><td>VNA</td><td>{}</td><td>0,31</td><td>P</td><td>15/05/2021</td></tr>'
+            '</table></center></div>'
+        ).format(id, id[5:], date, value)
+    with open(fname, 'w', encoding='latin1') as fp:
+        fp.write('<html><body>{}{}{}</body></html>'.format(
+            table('listaNTN-B', '10/05/2021', '3.669,919478'),
+            table('listaNTN-C', '10/05/2021', '5.534,204523'),
+            table('listaLFT', '10/05/2021', '10.850,110350')))
+
+
+def gen_taxaswap(fname, n):
+    rnd = random.Random(n)
+    curves = ['PRE', 'DIC', 'DOC', 'TR ', 'ACC']
+    per_curve = max(n // len(curves), 1)
+    with open(fname, 'w') as fp:
+        for k, curve in enumerate(curves):
+            for i in range(per_curve):
+                rate = rnd.uniform(-1e9, 1e10)
+                fp.write('000001' + '001' + '01' + '20210510' + '01' + curve.ljust(5)
+                         + ('TAXA ' + curve).ljust(15) + '%05d' % (i + 1)
+                         + '%05d' % (i + 1) + ('-' if rate < 0 else '+')
+                         + '%014d' % abs(rate) + 'F' + '%05d' % k + '\n')
+
+
+def gen_cdiidi(fname, n=None):
+    with open(fname, 'w') as fp:
+        json.dump({'taxa': '4,15', 'dataTaxa': '10/05/2021', 'indice': '60.532,59',
+                   'dataIndice': '10/05/2021'}, fp)
+
+
+def gen_stock_index_info(fname, n):
+    rnd = random.Random(n)
+    indexes = ['IBOV', 'IBXX', 'IBXL', 'SMLL', 'IDIV', 'IFIX', 'ICON']
+    results = [{'company': 'EMPRESA %d' % (i // 3), 'spotlight': 'ON NM', 'code': symbol,
+                'indexes': ','.join(rnd.sample(indexes, rnd.randint(1, 4)))}
+               for i, symbol in enumerate(_symbols(rnd, n))]
+    with open(fname, 'w') as fp:
+        json.dump({'header': {'update': '2021-05-10', 'startMonth': '01', 'endMonth': '04',
+                              'year': '2021'}, 'results': results}, fp)
+
+
+def gen_informes_diarios(fname, n):
+    rnd = random.Random(n)
+    with open(fname, 'w', encoding='latin1') as fp:
+        fp.write('CNPJ_FUNDO;DT_COMPTC;VL_TOTAL;VL_QUOTA;VL_PATRIM_LIQ;CAPTC_DIA;RESG_DIA;NR_COTST\n')
+        for i, dt in enumerate(_dates(n)):
+            cnpj = '%014d' % (i % 997 * 1000003)
+            fp.write('{}.{}.{}/{}-{};{};{:.2f};{:.12f};{:.2f};{:.2f};{:.2f};{}\n'.format(
+                cnpj[:2], cnpj[2:5], cnpj[5:8], cnpj[8:12], cnpj[12:], dt.isoformat(),
+                rnd.uniform(1e5, 1e9), rnd.uniform(1, 10), rnd.uniform(1e5, 1e9),
+                rnd.uniform(0, 1e6), rnd.uniform(0, 1e6), rnd.randint(1, 10 ** 5)))
+
+
+def gen_info_cadastral(fname, n):
+    rnd = random.Random(n)
+    with open(fname, 'w', encoding='latin1') as fp:
+        fp.write('CNPJ_FUNDO;DENOM_SOCIAL;DT_REG;DT_CONST;DT_CANCEL;SIT;DT_INI_SIT;'
+                 'DT_INI_ATIV;DT_INI_EXERC;DT_FIM_EXERC;CLASSE;DT_INI_CLASSE;RENTAB_FUNDO;'
+                 'CONDOM;FUNDO_COTAS;FUNDO_EXCLUSIVO;TRIB_LPRAZO;INVEST_QUALIF;TAXA_PERFM;'
+                 'INF_TAXA_PERFM;TAXA_ADM;INF_TAXA_ADM;VL_PATRIM_LIQ;DT_PATRIM_LIQ;DIRETOR;'
+                 'CNPJ_ADMIN;ADMIN;PF_PJ_GESTOR;CPF_CNPJ_GESTOR;GESTOR;CNPJ_AUDITOR;AUDITOR;'
+                 'CNPJ_CUSTODIANTE;CUSTODIANTE;CNPJ_CONTROLADOR;CONTROLADOR\n')
+        for i in range(n):
+            cnpj = '%014d' % (i * 1000003)
+            row = ['{}.{}.{}/{}-{}'.format(cnpj[:2], cnpj[2:5], cnpj[5:8], cnpj[8:12], cnpj[12:]),
+                   'FUNDO DE INVESTIMENTO %d' % i, '2003-04-30', '2003-04-30', '',
+                   'EM FUNCIONAMENTO NORMAL', '2003-04-30', '2003-05-02', '2021-01-01',
+                   '2021-12-31', 'Fundo de Ações', '2003-04-30', 'IBOVESPA', 'Aberto', 'N',
+                   'N', 'S', 'N', '%.1f' % rnd.uniform(0, 20), '', '%.2f' % rnd.uniform(0, 2),
+                   '', '%.2f' % rnd.uniform(1e5, 1e9), '2021-04-30', 'DIRETOR',
+                   '00.000.000/0001-91', 'ADMIN', 'PJ', '00.000.000/0001-91', 'GESTOR',
+                   '', '', '', '', '', '']
+            fp.write(';'.join(row) + '\n')
@@ -1,6 +1,7 @@
 
 import os
 import tempfile
+from datetime import date
 from kyd.parsers import unzip_and_get_content, unzip_to
 
 def test_unzip():
@@ -15,4 +16,34 @@ def test_unzip():
 
     destdir = tempfile.gettempdir()
     dest = unzip_to('data/TS190910.ex_', destdir)
-    assert os.path.exists(dest)
\ No newline at end of file
+    assert os.path.exists(dest)
+
+def test_session_pool():
+    import requests
+    from kyd.data.downloaders import SessionPool, RawURLDownloader, B3FilesURLDownloader
+
+    class FakeSession(requests.Session):
+        def request(self, method, url, **kwargs):
+            calls.append((self, method, url))
+            res = requests.Response()
+            res.status_code = 200
+            res._content = b'{"token": "abc"}'
+            return res
+
+    calls = []
+    pool = SessionPool(pool_maxsize=4, session_factory=FakeSession)
+    x = RawURLDownloader(url='https://a.com/file.txt', session_pool=pool)
+    _, tfile, status_code, _ = x.download()
+    assert status_code == 200 and tfile.read() == b'{"token": "abc"}'
+    x = B3FilesURLDownloader(filename='TaxaSwap', session_pool=pool)
+    x.download(refdate=date(2021, 5, 10))
+    x = RawURLDownloader(url='https://a.com/other.txt', session_pool=pool)
+    x.download()
+    sessions = [s for s, _, _ in calls]
+    # the B3 token and file requests share one session, a.com another one
+    assert sessions[0] is sessions[3] and sessions[1] is sessions[2]
+    assert sessions[0] is not sessions[1]
+    assert calls[2][2] == 'https://arquivos.b3.com.br/api/download/?token=abc'
+    adapter = sessions[1].get_adapter('https://arquivos.b3.com.br/api')
+    assert adapter._pool_maxsize == 4
+    pool.close()
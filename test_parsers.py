@@ -1,8 +1,17 @@
+import os
 
-from kyd.parsers import unzip_to
+import pytest
+import numpy as np
+import pandas as pd
+
+from kyd.parsers import unzip_to, PathExtractor
 from kyd.parsers.b3 import CDIIDI, BVBG028, BVBG086, TaxaSwap, BVBG087
-from kyd.parsers.b3 import COTAHIST
+from kyd.parsers.b3 import COTAHIST, COTAHIST_histdata, BVBGArchive, StockIndexInfo
+from kyd.parsers.cache import ParseCache
 from kyd.parsers.anbima import AnbimaTPF, AnbimaVnaTPF, AnbimaDebentures
+from synthetic_files import (gen_cotahist, gen_bvbg028, gen_bvbg086, gen_bvbg087, gen_taxaswap,
+                             gen_cdiidi, gen_stock_index_info, gen_tpf, gen_debentures, gen_vna,
+                             gen_informes_diarios, gen_info_cadastral)
 
 def test_CDIIDI():
     x = CDIIDI('data/CDIIDI_2019-09-22.json')
@@ -63,3 +72,679 @@ def test_AnbimaDebentures():
     assert len(x.data) > 0
 
 
+def _write_cotahist(path, n=10):
+    fname = str(path / 'COTAHIST_SYNTH.TXT')
+    gen_cotahist(fname, n)
+    return fname
+
+
+def test_fwf_iter_records(tmp_path):
+    fname = _write_cotahist(tmp_path, 10)
+    it = COTAHIST.iter_records(fname)
+    assert next(it)[0] == 'header'
+    rows = list(it)
+    assert [r[0] for r in rows] == ['data'] * 10 + ['trailer']
+    assert [r[1] for r in rows[:-1]] == COTAHIST(fname).data
+
+
+def test_fwf_as_frame(tmp_path):
+    fname = _write_cotahist(tmp_path, 10)
+    x = COTAHIST(fname)
+    df = COTAHIST(fname, as_frame=True)
+    assert len(df.data) == len(x.data)
+    assert len(df.header) == 1 and len(df.trailer) == 1
+    assert df.data['preco_max'].tolist() == [r['preco_max'] for r in x.data]
+    assert df.data['cod_bdi'].tolist() == [r['cod_bdi'] for r in x.data]
+    assert df.data['data_referencia'].tolist() == [r['data_referencia'] for r in x.data]
+    assert str(df.data['qtd_negocios'].dtype) == 'int64'
+
+
+def test_fwf_compiled_row_parser(tmp_path):
+    fname = _write_cotahist(tmp_path, 10)
+    with open(fname, encoding='latin1') as fp:
+        line = fp.readlines()[1]
+    row = COTAHIST_histdata()
+    expected = dict((name, dx[2](line[dx[0]:dx[1]].strip()))
+                    for name, dx in zip(row.names, row.colpositions))
+    assert COTAHIST_histdata.parse_line(line) == expected
+
+
+def test_fwf_on_error(tmp_path):
+    fname = _write_cotahist(tmp_path, 10)
+    with open(fname, encoding='latin1') as fp:
+        lines = fp.read().splitlines()
+    # an invalid data_vencimento (13th month)
+    bad_date = lines[1][:202] + '20201331' + lines[1][210:]
+    with open(fname, 'a', encoding='latin1') as fp:
+        fp.write('XX unknown record\r\n')
+        fp.write('01' + 'X' * 243 + '\r\n')
+        fp.write(bad_date + '\r\n')
+    for as_frame in (False, True):
+        with pytest.raises(ValueError):
+            COTAHIST(fname, as_frame=as_frame)
+        x = COTAHIST(fname, as_frame=as_frame, on_error='collect')
+        assert len(x.data) == 10
+        assert x.stats.lines == 15
+        assert x.stats.unmatched == 1
+        assert [r[0] for r in x.stats.rejected] == [13, 14, 15]
+        assert x.stats.rejected[-1] == (15, bad_date, 'malformed')
+    x = COTAHIST(fname, on_error='skip')
+    assert x.stats.malformed == 2 and x.stats.rejected == []
+    # the invalid date alone
+    with open(fname, 'w', encoding='latin1') as fp:
+        fp.write('\r\n'.join(lines[:-1] + [bad_date] + lines[-1:]) + '\r\n')
+    for as_frame in (False, True):
+        with pytest.raises(ValueError):
+            COTAHIST(fname, as_frame=as_frame)
+        x = COTAHIST(fname, as_frame=as_frame, on_error='collect')
+        assert len(x.data) == 10 and x.stats.rejected == [(12, bad_date, 'malformed')]
+    # a data line cut at 236 characters
+    with open(fname, 'w', encoding='latin1') as fp:
+        fp.write('\r\n'.join(lines[:-1] + [lines[1][:236]] + lines[-1:]) + '\r\n')
+    for kwargs in [{}, {'reader': 'mmap'}, {'as_frame': True}]:
+        with pytest.raises(ValueError):
+            COTAHIST(fname, **kwargs)
+        x = COTAHIST(fname, on_error='collect', **kwargs)
+        assert len(x.data) == 10 and x.stats.rejected == [(12, lines[1][:236], 'malformed')]
+
+
+def test_fwf_workers(tmp_path):
+    fname = _write_cotahist(tmp_path, 50)
+    with open(fname, 'a', encoding='latin1') as fp:
+        fp.write('XX unknown record\r\n')
+    x = COTAHIST(fname, on_error='collect')
+    y = COTAHIST(fname, on_error='collect', workers=2)
+    assert y.data == x.data
+    assert y.header == x.header and y.trailer == x.trailer
+    assert y.stats.rejected == x.stats.rejected == [(53, 'XX unknown record', 'unmatched')]
+    df = COTAHIST(fname, as_frame=True, on_error='skip', workers=2)
+    assert df.data.equals(COTAHIST(fname, as_frame=True, on_error='skip').data)
+
+
+def test_fwf_mmap_reader(tmp_path):
+    fname = _write_cotahist(tmp_path, 20)
+    with open(fname, 'a', encoding='latin1') as fp:
+        fp.write('01' + 'X' * 243 + '\r\n')
+    x = COTAHIST(fname, on_error='collect')
+    y = COTAHIST(fname, on_error='collect', reader='mmap')
+    assert y.data == x.data
+    assert y.header == x.header and y.trailer == x.trailer
+    assert y.stats.rejected == x.stats.rejected
+    z = COTAHIST(fname, on_error='collect', reader='mmap', workers=2)
+    assert z.data == x.data and z.stats.rejected == x.stats.rejected
+    df = COTAHIST(fname, as_frame=True, on_error='skip', reader='mmap')
+    assert df.data.equals(COTAHIST(fname, as_frame=True, on_error='skip').data)
+
+
+def test_fwf_field_cache(tmp_path):
+    fname = _write_cotahist(tmp_path, 30)
+    field = COTAHIST_histdata.data_vencimento
+    field.cache_clear()
+    x = COTAHIST(fname)
+    info = field.cache_info()
+    assert info.misses == 1 and info.hits == 29
+    assert x.data[0]['data_vencimento'] is x.data[1]['data_vencimento']
+    assert COTAHIST_histdata.preco_max.cache_info() is None
+
+
+def test_fwf_columns_where(tmp_path):
+    fname = _write_cotahist(tmp_path, 30)
+    columns = ['cod_negociacao', 'data_referencia', 'preco_ult']
+    full = [r for r in COTAHIST(fname).data if r['cod_bdi'] == '02' and r['preco_ult'] > 50000]
+    expected = [dict((k, r[k]) for k in columns) for r in full]
+    assert 0 < len(expected) < 30
+    where = {'cod_bdi': '02', 'preco_ult': lambda x: int(x) > 5000000}
+    for reader in ('text', 'mmap'):
+        x = COTAHIST(fname, columns=columns, where=where, reader=reader)
+        assert x.data == expected
+        assert x.stats.filtered == 30 - len(expected)
+        df = COTAHIST(fname, as_frame=True, columns=columns, where=where, reader=reader)
+        assert list(df.data.columns) == columns
+        assert df.data.to_dict('records') == expected
+    x = COTAHIST(fname, columns=columns, where={'cod_bdi': ['02', '96']}, workers=2)
+    n = sum(r['cod_bdi'] in ('02', '96') for r in COTAHIST(fname).data)
+    assert 0 < n < 30 and len(x.data) == n and list(x.data[0]) == columns
+    with pytest.raises(ValueError):
+        COTAHIST(fname, columns=['unknown'])
+
+
+def test_fwf_where_callable_workers(tmp_path):
+    import threading
+    fname = _write_cotahist(tmp_path, 30)
+    errors = []
+
+    def parse():
+        try:
+            COTAHIST(fname, where={'preco_ult': lambda x: int(x) > 1010}, workers=2)
+        except ValueError as ex:
+            errors.append(ex)
+
+    # lambdas can't be sent to the workers, the parse fails instead of hanging
+    thread = threading.Thread(target=parse, daemon=True)
+    thread.start()
+    thread.join(timeout=60)
+    assert not thread.is_alive()
+    assert len(errors) == 1 and 'picklable' in str(errors[0])
+
+
+def test_parse_cache(tmp_path):
+    fname = _write_cotahist(tmp_path, 30)
+    cache = ParseCache(str(tmp_path / 'cache'))
+    x = cache.parse(COTAHIST, fname, as_frame=True)
+    y = cache.parse(COTAHIST, fname, as_frame=True)
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert y.data.equals(x.data)
+    assert isinstance(y.data['preco_ult'].values.base, np.memmap)
+    assert y.header.equals(x.header) and y.stats.lines == x.stats.lines
+    z = cache.parse(COTAHIST, fname)
+    assert z.data == COTAHIST(fname).data
+    assert cache.info().misses == 2
+    with open(fname, 'a', encoding='latin1') as fp:
+        fp.write('\r\n')
+    cache.max_bytes = cache.info().currsize
+    cache.parse(COTAHIST, fname, on_error='skip')
+    assert cache.misses == 3 and cache.evictions > 0
+    assert cache.info().currsize <= cache.max_bytes
+
+
+def test_synthetic_files(tmp_path):
+    from kyd.parsers.cvm import load_informes_diarios, load_info_cadastral
+    cases = [(gen_cotahist, lambda f: COTAHIST(f).data),
+             (gen_bvbg028, lambda f: BVBG028(f).data),
+             (gen_bvbg086, lambda f: BVBG086(f).data),
+             (gen_bvbg087, lambda f: BVBG087(f).data),
+             (gen_taxaswap, lambda f: TaxaSwap(f).data),
+             (gen_stock_index_info, lambda f: StockIndexInfo(f).data['symbol'].unique()),
+             (gen_tpf, lambda f: AnbimaTPF(f).data),
+             (gen_debentures, lambda f: AnbimaDebentures(f).data),
+             (gen_informes_diarios, lambda f: pd.concat(load_informes_diarios(f))),
+             (gen_info_cadastral, lambda f: pd.concat(load_info_cadastral(f)))]
+    for generate, parse in cases:
+        fname = str(tmp_path / generate.__name__)
+        generate(fname, 25)
+        assert len(parse(fname)) == 25, generate.__name__
+        with open(fname, 'rb') as fp:
+            content = fp.read()
+        generate(fname, 25)
+        with open(fname, 'rb') as fp:
+            assert fp.read() == content
+
+
+def test_BVBG028_iterparse(tmp_path):
+    fname = str(tmp_path / 'IN210510.xml')
+    gen_bvbg028(fname, 40)
+    x = BVBG028(fname)
+    y = BVBG028(fname, iterparse=True)
+    assert y.data == x.data and len(y.data) == 40
+    assert y.creation_date == x.creation_date == '2021-05-10'
+    assert list(BVBG028.iter_records(fname)) == x.data
+
+
+def test_path_extractor():
+    from lxml import etree
+    node = etree.fromstring(
+        '<a xmlns="urn:x"><b><c> 1 </c></b><b><c>2</c><d>3</d></b><e/></a>')
+    paths = {'c': 'b/c', 'd': 'b/d', 'e': 'e', 'f': 'b/f'}
+    assert PathExtractor(paths, 'urn:x').extract(node) == {'c': ' 1 ', 'd': '3', 'e': None}
+    x = PathExtractor(paths, 'urn:x', strip=True, keep_missing=True).extract(node)
+    assert x == {'c': '1', 'd': '3', 'e': None, 'f': None}
+
+
+def test_BVBG086_to_frame(tmp_path):
+    fname = str(tmp_path / 'PR210510.xml')
+    gen_bvbg086(fname, 30)
+    x = BVBG086(fname)
+    df = x.to_frame()
+    assert list(df.columns) == list(BVBG086.DTYPES) and len(df) == 30
+    assert df['last_price'].dtype == 'float64' and df['trade_quantity'].dtype == 'Int64'
+    assert df['trade_date'].dtype == 'datetime64[ns]'
+    assert df['security_market'].dtype == 'category'
+    assert df['open_interest'].isna().all()
+    assert df['last_price'].tolist() == [float(r['last_price']) for r in x.data]
+    assert df['trade_quantity'].tolist() == [int(r['trade_quantity']) for r in x.data]
+
+
+def test_BVBG087_single_pass(tmp_path):
+    fname = str(tmp_path / 'IR210510.xml')
+    gen_bvbg087(fname, 30)
+    x = BVBG087(fname)
+    assert [r['index_type'] for r in x.data] == ['IndxInf'] * 10 + ['IOPVInf'] * 10 + ['BDRInf'] * 10
+    assert all(r['trade_date'] == '2021-05-10' for r in x.data)
+    assert x.data[0]['rising_shares_number'] == '10' and 'ref_price' in x.data[20]
+    assert BVBG087(fname, iterparse=True).data == x.data
+
+
+def test_BVBGArchive(tmp_path, monkeypatch):
+    import zipfile
+    from kyd.parsers import read_zip_member
+    for name, gen in [('IN.xml', gen_bvbg028), ('PR.xml', gen_bvbg086), ('IR.xml', gen_bvbg087)]:
+        gen(str(tmp_path / name), 20)
+    inner = str(tmp_path / 'inner.zip')
+    with zipfile.ZipFile(inner, 'w') as zf:
+        zf.write(str(tmp_path / 'PR.xml'), 'PR_2.xml')
+        zf.write(str(tmp_path / 'IR.xml'), 'IR.xml')
+    fname = str(tmp_path / 'archive.zip')
+    with zipfile.ZipFile(fname, 'w') as zf:
+        zf.write(str(tmp_path / 'PR.xml'), 'PR_1.xml')
+        zf.write(inner, 'inner.zip')
+        zf.write(str(tmp_path / 'IN.xml'), 'IN.xml')
+        zf.writestr('readme.txt', 'not a document')
+    with pytest.raises(ValueError):
+        BVBGArchive(fname)
+    for workers in (None, 2):
+        x = BVBGArchive(fname, workers=workers, on_error='skip')
+        assert [m.name for m in x.members] == [
+            ('PR_1.xml',), ('inner.zip', 'PR_2.xml'), ('inner.zip', 'IR.xml'), ('IN.xml',),
+            ('readme.txt',)]
+        assert [type(m.parser) for m in x.members] == [BVBG086, BVBG086, BVBG087, BVBG028,
+                                                        type(None)]
+        assert x.members[-1].error == 'unknown document'
+        assert x.data == (BVBG086(str(tmp_path / 'PR.xml')).data * 2
+                          + BVBG087(str(tmp_path / 'IR.xml')).data
+                          + BVBG028(str(tmp_path / 'IN.xml')).data)
+        assert all(seconds > 0 for _, seconds in x.timings)
+
+    # a corrupt member is reported and the others are parsed
+    with open(str(tmp_path / 'IN.xml'), 'rb') as fp:
+        content = fp.read()
+    with zipfile.ZipFile(fname, 'a', compression=zipfile.ZIP_STORED) as zf:
+        zf.writestr('IN_2.xml', content)
+    with open(fname, 'rb') as fp:
+        raw = bytearray(fp.read())
+    pos = raw.rindex(content[-50:])
+    raw[pos] ^= 1
+    with open(fname, 'wb') as fp:
+        fp.write(raw)
+    x = BVBGArchive(fname, on_error='skip')
+    assert x.members[-1].name == ('IN_2.xml',) and 'CRC' in x.members[-1].error
+    assert [type(m.parser) for m in x.members[:4]] == [BVBG086, BVBG086, BVBG087, BVBG028]
+    # the inner zip is read once for all of its members
+    from kyd.parsers import b3
+    calls = []
+    monkeypatch.setattr(b3, 'read_zip_member',
+                        lambda *args: calls.append(args) or read_zip_member(*args))
+    BVBGArchive(fname, on_error='skip')
+    assert calls == [(fname, ('inner.zip',))]
+
+
+def test_parsers_read_zip_members_and_bytes(tmp_path):
+    import io
+    import zipfile
+    from kyd.parsers import open_zip_member
+    cases = [(COTAHIST, gen_cotahist), (BVBG028, gen_bvbg028),
+             (BVBG086, gen_bvbg086), (BVBG087, gen_bvbg087),
+             (TaxaSwap, gen_taxaswap), (AnbimaTPF, gen_tpf),
+             (AnbimaDebentures, gen_debentures),
+             (AnbimaVnaTPF, gen_vna), (CDIIDI, gen_cdiidi)]
+    fname = str(tmp_path / 'files.ex_')
+    with zipfile.ZipFile(fname, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for cls, gen in cases:
+            gen(str(tmp_path / cls.__name__), 20)
+            zf.write(str(tmp_path / cls.__name__), cls.__name__)
+    def records(x):
+        return x.data.to_dict('records') if isinstance(x.data, pd.DataFrame) else x.data
+
+    for cls, gen in cases:
+        expected = records(cls(str(tmp_path / cls.__name__)))
+        with open(str(tmp_path / cls.__name__), 'rb') as fp:
+            content = fp.read()
+        assert records(cls(content)) == expected
+        assert records(cls(io.BytesIO(content))) == expected
+        with open_zip_member(fname, cls.__name__) as fp:
+            assert records(cls(fp)) == expected
+    with open_zip_member(fname, 0) as fp:
+        x = COTAHIST(fp, reader='mmap')
+    assert x.data == COTAHIST(str(tmp_path / 'COTAHIST')).data
+    with open_zip_member(fname, 0) as fp:
+        assert COTAHIST(fp, as_frame=True).data.equals(
+            COTAHIST(str(tmp_path / 'COTAHIST'), as_frame=True).data)
+
+
+def test_StockIndexInfo(tmp_path):
+    import json
+    payload = {
+        'header': {'update': '2021-05-10', 'startMonth': '01', 'endMonth': '04', 'year': '2021'},
+        'results': [
+            {'company': 'B', 'spotlight': 'ON', 'code': 'BBBB3', 'indexes': 'IBOV,SMLL'},
+            {'company': 'A', 'spotlight': 'PN', 'code': 'AAAA4', 'indexes': 'IDIV'},
+            {'company': 'A', 'spotlight': 'ON', 'code': 'AAAA3', 'indexes': 'IBOV,IDIV,IBXX'},
+        ]
+    }
+    fname = str(tmp_path / 'GetStockIndex.json')
+    with open(fname, 'w') as fp:
+        json.dump(payload, fp)
+    x = StockIndexInfo(fname)
+    assert x.data[['symbol', 'indexes']].values.tolist() == [
+        ['AAAA3', 'IBOV'], ['AAAA3', 'IDIV'], ['AAAA3', 'IBXX'], ['AAAA4', 'IDIV'],
+        ['BBBB3', 'IBOV'], ['BBBB3', 'SMLL']]
+    assert list(x.data.columns) == [
+        'corporation_name', 'specification_code', 'symbol', 'indexes', 'refdate',
+        'duration_start_month', 'duration_end_month', 'duration_year']
+    assert x.indexes('AAAA3') == {'IBOV', 'IDIV', 'IBXX'} and x.indexes('XXXX3') == set()
+    assert x.symbols('IBOV').tolist() == ['AAAA3', 'BBBB3'] and len(x.symbols('XXXX')) == 0
+
+
+ANBIMA_TPF_FIXTURE = '''ANBIMA - Associação Brasileira das Entidades dos Mercados Financeiro e de Capitais
+
+Titulo@Data Referencia@Codigo SELIC@Data Base/Emissao@Data Vencimento@Tx. Compra@Tx. Venda@Tx. Indicativas@PU@Desvio padrao@Interv. Ind. Inf. (D0)@Interv. Ind. Sup. (D0)@Interv. Ind. Inf. (D+1)@Interv. Ind. Sup. (D+1)@Criterio
+LTN@20210510@100000@20190104@20210701@3,2811@3,2608@3,2702@995,524108@0,00285161@3,0556@3,4882@3,0693@3,5133@Calculado
+LTN@20210510@100000@20200110@20220101@4,4302@4,4148@4,4224@970,885321@0,00440087@4,0717@4,7694@4,1001@4,8137@Calculado
+LFT@20210510@210100@20000701@20270301@0,0215@0,0184@0,0201@10850,110350@0,00102010@-0,0300@0,0700@-0,0272@0,0762@Calculado
+NTN-F@20210510@950199@20180105@20310101@8,9850@8,9716@8,9784@1000@0,00521477@8,5214@9,4288@8,5511@9,4622@Calculado
+NTN-B@20210510@760199@20000715@20450515@4,3856@4,3700@4,3780@3962,451920@0,00376212@--@--@4,0010@4,7661@Calculado
+'''
+
+ANBIMA_DEBENTURES_FIXTURE = '''ANBIMA
+
+Código@Nome@Repac./  Venc.@Índice/ Correção@Taxa de Compra@Taxa de Venda@Taxa Indicativa@Desvio Padrão@Intervalo Indicativo Minimo@Intervalo Indicativo Máximo@PU@% PU Par@Duration@% Reune@Referência NTN-B
+AALM12@ALMEIDA JUNIOR SHOPPING CENTERS S.A.@15/12/2022@DI + 1,6500%@--@--@1,6025@0,0313@1,3963@1,8087@1.012,394155@100,06@394,0@--@--
+AEGP23@AEGEA SANEAMENTO E PARTICIPACOES S.A.@15/12/2027@IPCA + 5,2579%@5,0500@4,9500@5,0173@0,0502@4,5741@5,4605@1.087,101932@100@1.652,0@--@15/08/2026
+ALGA27@ALGAR TELECOM S/A@15/03/2027@IPCA + 5,8000%@N/D@N/D@4,6150@0,0411@4,2250@5,0050@1.128,440302@107,54@1.601@2,6@15/08/2026
+'''
+
+
+def test_typed_same_as_rules(tmp_path):
+    for cls, text in [(AnbimaTPF, ANBIMA_TPF_FIXTURE),
+                      (AnbimaDebentures, ANBIMA_DEBENTURES_FIXTURE)]:
+        fname = tmp_path / (cls.__name__ + '_2021-05-10.txt')
+        fname.write_text(text, encoding='latin1')
+        x, y = cls(str(fname)).data, cls(str(fname), typed=True).data
+        if isinstance(x, pd.DataFrame):
+            pd.testing.assert_frame_equal(x, y)
+            continue
+        assert x == y
+        assert [[type(v) for v in r.values()] for r in x] == \
+            [[type(v) for v in r.values()] for r in y]
+
+
+def test_typed_columns(tmp_path):
+    from kyd.parsers import TypedColumns, PortugueseRulesParser2, convert_csv_to_dict
+    pp = PortugueseRulesParser2()
+    typed = TypedColumns(TypedColumns.PTBR, pp.parse)
+    assert typed.infer(['20210510', '20210511']) == 'date_YYYYMMDD'
+    assert typed.infer(['10/05/2021', 'N/D']) == 'date_ptBR'
+    assert typed.infer(['1', '1.234,5', '--']) == 'decimal_ptBR'
+    assert typed.infer(['1', 'a']) is None
+    convert = typed.column_converter('x', ['1,5', '2,5'])
+    values = [convert(x) for x in ['1.234,5', '--', '7', 'abc', '-7']]
+    assert values == [1234.5, None, 7, 'abc', pp.parse('-7')]
+    assert [type(x) for x in values] == [type(pp.parse(x)) for x in ['1.234,5', '--', '7', 'abc', '-7']]
+    for cls, gen in [(AnbimaTPF, gen_tpf),
+                     (AnbimaDebentures, gen_debentures)]:
+        fname = str(tmp_path / cls.__name__)
+        gen(fname, 50)
+        x, y = cls(fname).data, cls(fname, typed=True).data
+        assert (x.equals(y) if isinstance(x, pd.DataFrame) else x == y)
+    fname = str(tmp_path / 'inf_diario.csv')
+    gen_informes_diarios(fname, 50)
+    with open(fname, 'rb') as fp:
+        lines = fp.readlines()
+    assert list(convert_csv_to_dict(lines, typed=True)) == list(convert_csv_to_dict(lines))
+
+
+def test_cvm_loaders(tmp_path):
+    from kyd.parsers.cvm import (handle_informes_diarios, handle_info_cadastral,
+                                 load_informes_diarios, load_info_cadastral, cnpj_key)
+    assert cnpj_key(['00.017.024/0001-53', '17024000153', '1.234/5']).tolist() == \
+        [17024000153, 17024000153, 12345]
+    assert cnpj_key([]).dtype == np.int64 and len(cnpj_key([])) == 0
+    assert cnpj_key([None, np.nan, 'N/D', '1']).tolist() == [-1, -1, -1, 1]
+    header = tmp_path / 'header.csv'
+    header.write_text('CNPJ_FUNDO;DT_COMPTC;VL_TOTAL;VL_QUOTA;VL_PATRIM_LIQ;'
+                      'CAPTC_DIA;RESG_DIA;NR_COTST\n')
+    assert sum(len(df) for df in load_informes_diarios(str(header))) == 0
+    for handle, load, gen in [(handle_informes_diarios, load_informes_diarios,
+                               gen_informes_diarios),
+                              (handle_info_cadastral, load_info_cadastral,
+                               gen_info_cadastral)]:
+        fname = str(tmp_path / gen.__name__)
+        gen(fname, 250)
+        chunks = list(load(fname, chunksize=100))
+        assert [len(df) for df in chunks] == [100, 100, 50]
+        df = pd.concat(chunks, ignore_index=True)
+        assert df['cnpj_fundo'].dtype == np.int64
+        with open(fname, encoding='latin1') as fp:
+            next(fp)
+            rows = [handle(line) for line in fp]
+        assert df['cnpj_fundo'].tolist() == [int(cnpj) for cnpj, _ in rows]
+        assert np.allclose(df['vl_patrim_liq'], [row['vl_patrim_liq'] for _, row in rows])
+    x = next(load_informes_diarios(fname.replace('info_cadastral', 'informes_diarios')))
+    assert x['dt_comptc'].dtype.kind == 'M' and x['nr_cotst'].dtype == 'Int64'
+    assert df['dt_reg'].dtype.kind == 'M' and df['dt_cancel'].isna().all()
+
+
+def test_informes_diarios_store(tmp_path):
+    from kyd.parsers.cvm import InformesDiariosStore, load_informes_diarios
+    fname = str(tmp_path / 'inf_diario.csv')
+    gen_informes_diarios(fname, 3000)
+    store = InformesDiariosStore(str(tmp_path / 'informes.db'))
+    assert store.ingest(fname, chunksize=1000) == 3000
+    assert store.ingest(fname) == 0
+    df = next(load_informes_diarios(fname))
+    df.loc[0, 'vl_quota'] = 1.5
+    df.loc[1, 'nr_cotst'] = pd.NA
+    assert store.upsert(df) == 2
+    cnpj = df['cnpj_fundo'][0]
+    df = pd.concat(load_informes_diarios(fname))
+    df.loc[0, 'vl_quota'] = 1.5
+    x = df[df['cnpj_fundo'] == cnpj].set_index('dt_comptc')[list(store.COLUMNS)]
+    y = store.series(cnpj)
+    pd.testing.assert_frame_equal(x, y)
+    assert y['vl_quota'].iloc[0] == 1.5
+    start = x.index[1]
+    assert store.series('%014d' % cnpj, start=start).index.tolist() == x.index[1:].tolist()
+    assert len(store.series(cnpj, end='1900-01-01')) == 0
+    store.close()
+    # the schema and the journal mode are kept when the store is opened again
+    store = InformesDiariosStore(str(tmp_path / 'informes.db'))
+    assert store.conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    pd.testing.assert_frame_equal(store.series(cnpj), y)
+    store.close()
+
+
+def test_TaxaSwap_curves(tmp_path):
+    fname = str(tmp_path / 'taxaswap.txt')
+    gen_taxaswap(fname, 50)
+    with open(fname) as fp:
+        lines = fp.readlines()
+    # curves are grouped by first appearance even if the file is not sorted
+    with open(fname, 'w') as fp:
+        fp.writelines(lines[10:] + lines[:10])
+    x = TaxaSwap(fname)
+    assert [c['id'] for c in x.findata] == ['DIC', 'DOC', 'TR', 'ACC', 'PRE']
+    assert len(x.findata[-1]['rates']) == 10
+    assert x.findata[0]['business_days'].dtype.kind == 'i'
+    curve = x.curve('PRE')
+    assert np.allclose(curve(curve.terms), curve.rates)
+    assert np.allclose(curve.linear([0, 1.5, 100]), [
+        curve.rates[0], (curve.rates[0] + curve.rates[1]) / 2, curve.rates[-1]])
+    # the compounding factor is exponentially interpolated
+    factor = lambda r, t: (1 + r / 100) ** (t / 252)
+    f = np.sqrt(factor(curve.rates[0], 1) * factor(curve.rates[1], 2))
+    assert np.isclose(factor(curve.flat_forward(1.5), 1.5), f)
+    assert curve.flat_forward(np.arange(1, 5001)).shape == (5000,)
+
+
+def test_run_batch(tmp_path):
+    from kyd.parsers.batch import find_files, run_batch, main
+    for day in ['2021-05-10', '2021-05-11']:
+        gen_tpf(str(tmp_path / 'ANBIMA_TPF_{}.txt'.format(day)), 20)
+    # a file that can not be read
+    (tmp_path / 'ANBIMA_TPF_2021-05-12.txt').mkdir()
+    fnames = find_files(str(tmp_path / 'ANBIMA_TPF_*.txt'))
+    assert fnames == find_files(start='2021-05-08', end='2021-05-13',
+                                template=str(tmp_path / 'ANBIMA_TPF_%Y-%m-%d.txt'))
+    res = run_batch(AnbimaTPF, fnames, workers=2)
+    assert [f.error is None for f in res.files] == [True, True, False]
+    rows = sum(f.rows for f in res.files)
+    assert len(res.data) == rows == 2 * len(AnbimaTPF(fnames[0]).data)
+    assert res.data['source'].tolist() == [fnames[0]] * (rows // 2) + [fnames[1]] * (rows // 2)
+    output = tmp_path / 'output'
+    assert main(['AnbimaTPF', str(tmp_path / '*.txt'), '-w', '1', '-o', str(output)]) == 1
+    assert sorted(p.name for p in output.iterdir()) == [
+        'ANBIMA_TPF_2021-05-10.csv', 'ANBIMA_TPF_2021-05-11.csv']
+    # parser arguments from the command line
+    fname = _write_cotahist(tmp_path, 30)
+    out = str(tmp_path / 'cotahist.csv')
+    assert main(['COTAHIST', fname, '-f', out, '--option', "columns=['cod_negociacao']",
+                 '--option', "where={'cod_bdi': '02'}", '--option', 'workers=2']) == 0
+    df = pd.read_csv(out)
+    n = sum(r['cod_bdi'] == '02' for r in COTAHIST(fname).data)
+    assert list(df.columns) == ['cod_negociacao', 'source'] and 0 < len(df) == n < 30
+    assert main(['AnbimaTPF', str(tmp_path / 'ANBIMA_TPF_2021-05-1[01].txt'), '-f', out,
+                 '--option', 'typed=True']) == 0
+    pd.testing.assert_frame_equal(pd.read_csv(out), res.data.astype({'cod_selic': int}))
+    with pytest.raises(SystemExit):
+        main(['AnbimaTPF', str(tmp_path / '*.txt'), '--option', 'typed'])
+    # files with the same name in per date directories
+    for day, n in [('20210510', 20), ('20210511', 10)]:
+        (tmp_path / 'bt' / day).mkdir(parents=True)
+        gen_tpf(str(tmp_path / 'bt' / day / 'TPF.txt'), n)
+    gen_tpf(str(tmp_path / 'bt' / '20210511' / 'TPF.dat'), 10)
+    fnames = find_files(str(tmp_path / 'bt' / '*' / 'TPF.*'))
+    res = run_batch(AnbimaTPF, fnames, workers=2, output=str(output))
+    assert [f.error is None for f in res.files] == [True, True, False]
+    assert 'already written' in res.files[2].error
+    for f in res.files[:2]:
+        csv = output / os.path.relpath(os.path.splitext(f.fname)[0] + '.csv', str(tmp_path / 'bt'))
+        assert len(pd.read_csv(str(csv))) == f.rows == len(AnbimaTPF(f.fname).data)
+
+
+def test_vna_extractor(tmp_path):
+    import io
+    from kyd.parsers.anbima import parse_vnatitpub, parse_vnataxatitpub, parse_vna_pages
+    fname = str(tmp_path / 'vna.html')
+    gen_vna(fname)
+    with open(fname, 'rb') as fp:
+        text = fp.read()
+    x = AnbimaVnaTPF(fname).data
+    assert [r['instrument_ref'] for r in x] == ['NTN-B', 'NTN-C', 'LFT']
+    buf = io.StringIO()
+    assert parse_vnatitpub(text, buf) == x[-1]['refdate']
+    assert buf.getvalue().splitlines()[1:] == [
+        '2021-05-10,NTNB,3669.919478', '2021-05-10,NTNC,5534.204523', '2021-05-10,LFT,10850.11035']
+    buf = io.StringIO()
+    parse_vnataxatitpub(text, buf)
+    assert buf.getvalue().splitlines()[1:] == [
+        '2021-05-10,IPCA,0.31,P,2021-05-15', '2021-05-10,IGPM,0.31,P,2021-05-15',
+        '2021-05-10,SELIC,0.31,,']
+    df = parse_vna_pages([fname, text])
+    assert len(df) == 6 and df['value'].tolist() == [r['value'] for r in x] * 2
+    # comments between the cells are not counted as cells
+    with open(fname, 'w', encoding='latin1') as fp:
+        fp.write(text.decode('latin1').replace('<td>VNA</td>', '<!-- x --><td>VNA</td><!-- y -->'))
+    assert AnbimaVnaTPF(fname).data == x
+    with open(fname, 'rb') as fp:
+        buf = io.StringIO()
+        parse_vnatitpub(fp.read(), buf)
+    assert buf.getvalue().splitlines()[1] == '2021-05-10,NTNB,3669.919478'
+
+
+def test_bond_analytics():
+    import bizdays
+    from kyd.parsers.bonds import business_days, price, bond_yield, duration, analytics
+    cal = bizdays.Calendar.load('ANBIMA')
+    bd = business_days()
+    assert bd is business_days()
+    assert bd.count('2021-05-10', '2021-11-16') == cal.bizdays('2021-05-10', '2021-11-16')
+    # LTN maturing on a holiday pays on the following business day
+    du = cal.bizdays('2021-05-10', '2022-01-03')
+    assert np.isclose(price(['LTN'], ['2021-05-10'], ['2022-01-01'], [5.0])[0],
+                      1000 / 1.05 ** (du / 252))
+    assert np.isclose(duration(['LTN'], ['2021-05-10'], ['2022-01-01'], [5.0])[0], du / 252)
+    symbols = np.array(['LTN', 'NTN-F', 'NTN-B', 'LFT'] * 250)
+    refdate = np.full(len(symbols), '2021-05-10')
+    maturity = np.datetime64('2021-07-01') + np.arange(len(symbols)) * 3
+    rates = np.linspace(2, 15, len(symbols))
+    pu = price(symbols, refdate, maturity, rates, vna=np.full(len(symbols), 3000.0))
+    assert np.allclose(bond_yield(symbols, refdate, maturity, pu, vna=3000.0), rates)
+    dur = duration(symbols, refdate, maturity, rates)
+    years = bd.count(refdate, maturity) / 252
+    assert np.all(dur <= years + 1e-12) and np.allclose(dur[::4], years[::4])
+    assert np.isnan(price(['NTN-C', 'LTN'], ['2021-05-10'] * 2, ['2031-01-01', '2020-01-01'], [5, 5])).all()
+    df = analytics([dict(symbol='NTN-F', refdate='2021-05-10', maturity_date='2031-01-01',
+                         ref_yield=9.0, price=1000.0)])
+    assert df['business_days'][0] == cal.bizdays('2021-05-10', '2031-01-02')
+    assert 0 < df['duration'][0] < df['business_days'][0] / 252
+    # counts from the cached array, also backwards and out of its range
+    start = np.datetime64('1960-01-01') + np.arange(0, 40000, 7)
+    end = start[::-1] + 3
+    assert np.array_equal(bd.count(start, end), np.busday_count(start, end, busdaycal=bd.calendar))
+    df = analytics(dict(symbol=symbols, refdate=refdate, maturity_date=maturity, ref_yield=rates))
+    assert np.allclose(df['model_price'], price(symbols, refdate, maturity, rates))
+    assert np.allclose(df['duration'], dur)
+
+
+def test_parse_cache_code_digest(tmp_path, monkeypatch):
+    from kyd.parsers import cache
+    fname = _write_cotahist(tmp_path, 5)
+    c = ParseCache(str(tmp_path / 'cache'))
+    key = c.key(TaxaSwap, fname)
+    assert c.key(TaxaSwap, fname) == key and c.key(CDIIDI, fname) != key
+    # a change in the parser source gives a new key
+    fb3 = next(f for f in cache._module_digests if f.endswith('b3.py'))
+    monkeypatch.setitem(cache._module_digests, fb3, 'changed')
+    assert c.key(TaxaSwap, fname) != key
+
+
+class _FrameParser:
+    def __init__(self, fname):
+        self.data = pd.DataFrame({
+            'n': pd.array([1, None, 3], dtype='Int64'),
+            'ts': pd.date_range('2021-05-10', periods=3, tz='America/Sao_Paulo'),
+            'x': [1.5, 2.5, 3.5],
+        })
+
+
+def test_parse_cache_extension_dtypes(tmp_path):
+    fname = str(tmp_path / 'file.txt')
+    with open(fname, 'w') as fp:
+        fp.write('x')
+    cache = ParseCache(str(tmp_path / 'cache'))
+    x = cache.parse(_FrameParser, fname)
+    y = cache.parse(_FrameParser, fname)
+    assert cache.hits == 1
+    pd.testing.assert_frame_equal(x.data, y.data)
+    # a corrupt entry is parsed again
+    entry = os.path.join(cache.path, cache.key(_FrameParser, fname))
+    with open(os.path.join(entry, 'obj.pkl'), 'wb') as fp:
+        fp.write(b'corrupt')
+    z = cache.parse(_FrameParser, fname)
+    assert cache.misses == 2
+    pd.testing.assert_frame_equal(x.data, z.data)
+    assert cache.parse(_FrameParser, fname) is not None and cache.hits == 2
+
+
+def _is_stock(cod_bdi):
+    return cod_bdi == '02'
+
+
+def test_parse_cache_callables(tmp_path):
+    import io
+    fname = _write_cotahist(tmp_path, 30)
+    cache = ParseCache(str(tmp_path / 'cache'))
+    expected = COTAHIST(fname, where={'cod_bdi': '02'}).data
+    # a parser keeping a lambda can not be pickled, it is returned uncached
+    x = cache.parse(COTAHIST, fname, where={'cod_bdi': lambda v: v == '02'})
+    assert x.data == expected and cache.misses == 1 and not cache._entries()
+    # functions are keyed by their code, not by their address
+    key = cache.key(COTAHIST, fname, where={'cod_bdi': lambda v: v == '02'})
+    assert cache.key(COTAHIST, fname, where={'cod_bdi': lambda v: v == '02'}) == key
+    assert cache.key(COTAHIST, fname, where={'cod_bdi': lambda v: v == '10'}) != key
+    x = cache.parse(COTAHIST, fname, where={'cod_bdi': _is_stock})
+    y = cache.parse(COTAHIST, fname, where={'cod_bdi': _is_stock})
+    assert x.data == y.data == expected and cache.hits == 1
+    # file objects are hashed by their content and rewound
+    with open(fname, 'rb') as fp:
+        content = fp.read()
+    fp = io.BytesIO(content)
+    assert cache.digest(fp) == cache.digest(content) and fp.tell() == 0
+    assert cache.parse(COTAHIST, fp).data == COTAHIST(fname).data
+    assert cache.parse(COTAHIST, io.BytesIO(content)).data == COTAHIST(fname).data
+    assert cache.hits == 2
+
+    class Stream(io.RawIOBase):
+        def readable(self):
+            return True
+    with pytest.raises(TypeError, match='seekable'):
+        cache.parse(COTAHIST, Stream())